@@ -1,40 +1,136 @@
-import time
-import uuid
-from typing import List, Tuple, Dict, Any
+import argparse
 import json
 import logging
-from scipy.spatial.distance import cosine
-from firebase_admin import credentials, firestore, initialize_app
-from google.cloud.firestore_v1.vector import Vector
-from google.cloud.firestore_v1.base_query import FieldFilter
-from openai import OpenAI
 import os
+import re
+import subprocess
+import sys
+import time
+import uuid
+from functools import lru_cache
+from typing import List, Tuple, Dict, Any
+
+import numpy as np
 from dotenv import load_dotenv
-from sklearn.cluster import DBSCAN
-import schedule
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from newsify.cluster_index import ClusterIndex
+from newsify.cluster_layout import get_cluster_article_refs, get_cluster_first_seen, get_cluster_last_seen, get_legacy_article_keys
+from newsify.embeddings import DEFAULT_OPENAI_DIMENSIONS, LocalEmbeddingBackend, get_article_text, get_embedding_backend, get_stored_model_tag, legacy_model_tag
+from newsify.journal import RunJournal
+from newsify.openai_gateway import PRIORITY_HIGH, PRIORITY_LOW, OpenAIGateway
+from newsify.story_feed import StoryFeed
+from newsify.vector_store import VectorStore
+
+# Firebase, OpenAI, sklearn and schedule are only imported, and clients only created, once a
+# command needs them, so the CLI starts fast (see the startup-check command)
 logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Firebase
-cred = credentials.Certificate(os.getenv('FIREBASE_CRED_PATH'))
-initialize_app(cred)
-db = firestore.client()
+# Embeddings come from OpenAI, or from the local CPU backend when running offline.
+# Switch the crawler's EMBEDDING_BACKEND setting together with this one.
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'openai')
+# The OpenAI embedding model and its dimensions, the crawler's settings of the same names must match
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small')
+EMBEDDING_DIMENSIONS = int(os.getenv('EMBEDDING_DIMENSIONS', '512'))
+LOCAL_EMBEDDING_MODEL_PATH = os.getenv('LOCAL_EMBEDDING_MODEL_PATH', '.newsify/local_embeddings.joblib')
+LOCAL_PREFILTER_THRESHOLD = float(os.getenv('LOCAL_PREFILTER_THRESHOLD', '0.3'))
+
+# Local memory-mapped copies of article and cluster embeddings, synced incrementally
+VECTOR_STORE_DIR = os.getenv('VECTOR_STORE_DIR', '.newsify/vectors')
+VECTOR_STORE_QUANTIZATION = os.getenv('VECTOR_STORE_QUANTIZATION') or None
+
+# Journal of the current clustering run, an interrupted run resumes from it
+CLUSTER_JOURNAL_PATH = os.getenv('CLUSTER_JOURNAL_PATH', '.newsify/journal/clustering.jsonl')
+CLUSTER_RESUME_ATTEMPTS = int(os.getenv('CLUSTER_RESUME_ATTEMPTS', '3'))  # Failed resumes before a run's plan is abandoned
+
+CLUSTER_WINDOW = 7 * 24 * 60 * 60  # Clusters updated within the last 7 days are active
+CLUSTER_MERGE_THRESHOLD = float(os.getenv('CLUSTER_MERGE_THRESHOLD', '0.9'))
+CLUSTER_SPLIT_THRESHOLD = float(os.getenv('CLUSTER_SPLIT_THRESHOLD', '0.6'))
+CLUSTER_INTERVAL = int(os.getenv('CLUSTER_INTERVAL', '10'))  # Seconds between runs of the daemon
+
+# Modules that must not be imported just by starting the CLI
+DEFERRED_MODULES = ['firebase_admin', 'google.cloud.firestore', 'openai', 'sklearn', 'scipy', 'schedule', 'joblib']
+STARTUP_BUDGET = float(os.getenv('CLUSTER_STARTUP_BUDGET', '0.5'))
+
+@lru_cache(maxsize=None)
+def get_db():
+    from firebase_admin import credentials, firestore, initialize_app
+
+    initialize_app(credentials.Certificate(os.getenv('FIREBASE_CRED_PATH')))
+    return firestore.client()
+
+@lru_cache(maxsize=None)
+def get_gateway() -> OpenAIGateway:
+    # Shares its rate-limit state with the crawler
+    return OpenAIGateway(
+        api_key=os.getenv('OPENAI_API_KEY'),
+        state_path=os.getenv('OPENAI_GATEWAY_STATE_PATH', '.newsify/openai_gateway.sqlite'),
+        rate_limits=json.loads(os.getenv('OPENAI_RATE_LIMITS', '{}'))
+    )
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+@lru_cache(maxsize=None)
+def get_embedder():
+    gateway = get_gateway() if EMBEDDING_BACKEND == 'openai' else None
+    return get_embedding_backend(EMBEDDING_BACKEND, gateway=gateway, model_path=LOCAL_EMBEDDING_MODEL_PATH,
+                                 model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIMENSIONS)
+
+@lru_cache(maxsize=None)
+def get_local_backend():
+    # With a fitted local model, articles without an embedding yet are only embedded through
+    # OpenAI if the local backend finds them related to an active cluster or another new article
+    if EMBEDDING_BACKEND == 'openai' and os.path.exists(LOCAL_EMBEDDING_MODEL_PATH):
+        return LocalEmbeddingBackend.load(LOCAL_EMBEDDING_MODEL_PATH)
+    return None
+
+def get_store_suffix() -> str:
+    # One set of stores per embedding model, vectors of different models are never compared
+    model_tag = get_embedder().model_tag
+    if model_tag == legacy_model_tag(DEFAULT_OPENAI_DIMENSIONS):
+        return ''
+    return '-' + re.sub(r'[^a-zA-Z0-9.-]+', '-', model_tag)
+
+@lru_cache(maxsize=None)
+def get_article_store() -> VectorStore:
+    return VectorStore(os.path.join(VECTOR_STORE_DIR, f'articles{get_store_suffix()}'), dim=get_embedder().dimensions, quantization=VECTOR_STORE_QUANTIZATION)
+
+@lru_cache(maxsize=None)
+def get_cluster_store() -> VectorStore:
+    return VectorStore(os.path.join(VECTOR_STORE_DIR, f'clusters{get_store_suffix()}'), dim=get_embedder().dimensions, quantization=VECTOR_STORE_QUANTIZATION)
+
+@lru_cache(maxsize=None)
+def get_prefilter_store():
+    local_backend = get_local_backend()
+    if local_backend is None:
+        return None
+    return VectorStore(os.path.join(VECTOR_STORE_DIR, 'clusters-local'), dim=local_backend.dimensions)
+
+@lru_cache(maxsize=None)
+def get_cluster_index() -> ClusterIndex:
+    # Compact sharded copy of the active clusters' centroids, what assignment reads instead of article_clusters
+    return ClusterIndex(get_db(), shards=int(os.getenv('CLUSTER_INDEX_SHARDS', '16')))
+
+@lru_cache(maxsize=None)
+def get_story_feed() -> StoryFeed:
+    # Ranked, denormalized story feed pages for the read path, refreshed for the clusters each run changes
+    return StoryFeed(
+        get_db(),
+        page_size=int(os.getenv('STORY_FEED_PAGE_SIZE', '20')),
+        pages=int(os.getenv('STORY_FEED_PAGES', '10')),
+        half_life=float(os.getenv('STORY_FEED_HALF_LIFE_HOURS', '6')) * 60 * 60,
+        window=CLUSTER_WINDOW
+    )
+
+def get_new_articles(hours: int = 24) -> List[Dict[str, Any]]:
+    from google.cloud.firestore_v1.base_query import FieldFilter
 
-def get_new_articles() -> List[Dict[str, Any]]:
     logger.info("Fetching new articles...")
     articles = []
     current_time = int(time.time())
-    time_threshold = current_time - (24 * 60 * 60)  # 24 hours ago in Unix timestamp
+    time_threshold = current_time - (hours * 60 * 60)
     
-    for source in db.collection('news_sources').stream():
+    for source in get_db().collection('news_sources').stream():
         query = (source.reference.collection('articles')
                  .where(filter=FieldFilter("cluster_id", "==", -1))
                  .where(filter=FieldFilter("article_published_date", ">=", time_threshold)))
@@ -44,59 +140,171 @@ def get_new_articles() -> List[Dict[str, Any]]:
             article_data['source'] = source.id
             articles.append(article_data)
     
-    logger.info(f"Found {len(articles)} new articles within the last 24 hours.")
+    logger.info(f"Found {len(articles)} new articles within the last {hours} hours.")
     return articles
 
-def get_existing_clusters() -> List[Dict[str, Any]]:
-    logger.info("Fetching existing clusters...")
+def get_existing_clusters() -> List[str]:
+    logger.info("Syncing existing clusters...")
     current_time = int(time.time())
-    time_threshold = current_time - (7 * 24 * 60 * 60)  # 7 days ago in Unix timestamp
+    time_threshold = current_time - CLUSTER_WINDOW
+    cluster_index = get_cluster_index()
+    cluster_store = get_cluster_store()
     
-    clusters = [
-        cluster.to_dict() | {'id': cluster.id}
-        for cluster in db.collection('article_clusters')
-        .where(filter=FieldFilter("last_updated", ">=", time_threshold))
-        .stream()
+    # A few shard reads return every cluster's centroid, only changed ones are written to the local store
+    index = cluster_index.load()
+    if index is None:
+        index = cluster_index.rebuild(time_threshold)
+    # Centroids of another embedding model (or backend) cannot be compared with this one's embeddings
+    model_tag = get_embedder().model_tag
+    foreign = [cluster_id for cluster_id, entry in index.items() if entry[2] >= time_threshold and entry[3] != model_tag]
+    if foreign:
+        logger.warning(f"Ignoring {len(foreign)} active clusters embedded with another model than {model_tag}, `python cluster.py backfill-embeddings` re-embeds them.")
+    active = {cluster_id: entry for cluster_id, entry in index.items() if entry[2] >= time_threshold and entry[3] == model_tag}
+    changed = [
+        (cluster_id, centroid, last_updated)
+        for cluster_id, (centroid, _, last_updated, _) in active.items()
+        if cluster_store.updated.get(cluster_id, -1) < last_updated
     ]
+    cluster_store.add_many(changed)
+    
+    # Clusters merged away elsewhere, or gone quiet, leave the store and the index
+    for store in (cluster_store, get_prefilter_store()):
+        if store is not None:
+            store.remove([cluster_id for cluster_id in store.ids if cluster_id not in active])
+    expired = [cluster_id for cluster_id, entry in index.items() if entry[2] < time_threshold]
+    if expired:
+        batch = get_db().batch()
+        cluster_index.write(batch, removed=expired)
+        batch.commit()
+    gone = fill_prefilter_store({cluster_id: last_updated for cluster_id, (_, _, last_updated, _) in active.items()})
     
-    logger.info(f"Found {len(clusters)} existing clusters updated within the last 7 days.")
-    return clusters
+    cluster_ids = [cluster_id for cluster_id in active if cluster_id not in gone]
+    logger.info(f"Synced {len(changed)} changed clusters. Found {len(cluster_ids)} existing clusters updated within the last 7 days.")
+    return cluster_ids
+
+def fill_prefilter_store(active: Dict[str, int]) -> set:
+    """Embeds active clusters that have no pre-filter entry yet, e.g. after a local model is first fitted.
+
+    Returns the ids of clusters whose documents turned out to be gone.
+    """
+    prefilter_store = get_prefilter_store()
+    if prefilter_store is None:
+        return set()
+    missing = [cluster_id for cluster_id in active if cluster_id not in prefilter_store]
+    if not missing:
+        return set()
+    
+    logger.info(f"Embedding {len(missing)} clusters without a pre-filter entry locally...")
+    cluster_refs = [get_db().collection('article_clusters').document(cluster_id) for cluster_id in missing]
+    entries = []
+    gone = set()
+    for cluster_doc in get_db().get_all(cluster_refs):
+        if not cluster_doc.exists:
+            forget_cluster(cluster_doc.id)
+            gone.add(cluster_doc.id)
+            continue
+        cluster_data = cluster_doc.to_dict()
+        member_refs = get_cluster_article_refs(cluster_data)
+        articles = [
+            article_doc.to_dict()
+            for article_doc in get_db().get_all(member_refs, field_paths=['article_title', 'article_summary', 'article_content'])
+            if article_doc.exists
+        ]
+        # A cluster whose members were all deleted is still matched on its summary
+        text = get_cluster_text(articles) if articles else f"{cluster_data.get('cluster_title', '')}\n\n{cluster_data.get('cluster_content', '')}"
+        entries.append((cluster_doc.id, text))
+    if entries:
+        embeddings = get_local_backend().embed([text for _, text in entries])
+        prefilter_store.add_many([(cluster_id, embedding, active[cluster_id]) for (cluster_id, _), embedding in zip(entries, embeddings)])
+    return gone
+
+def article_key(article: Dict[str, Any]) -> str:
+    return f"{article['source']}/{article['id']}"
+
+def get_article_ref(key: str):
+    source, article_id = key.split('/')
+    return get_db().collection('news_sources').document(source).collection('articles').document(article_id)
 
-def get_article_embedding(article: Dict[str, Any]) -> List[float]:
+def get_cluster_id(articles: List[Dict[str, Any]]) -> str:
+    # Derived from the members, so a repeated attempt to create the same cluster writes the same document
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, 'newsify-cluster:' + ','.join(sorted(map(article_key, articles)))))
+
+def has_current_embedding(article: Dict[str, Any]) -> bool:
+    # Embeddings stored by another model or backend (e.g. before a model change) are embedded again
+    return 'article_embeddings' in article and get_stored_model_tag(article) == get_embedder().model_tag
+
+def get_article_embedding(article: Dict[str, Any]) -> np.ndarray:
+    article_store = get_article_store()
     logger.info(f"Getting embedding for article: {article['id']}")
-    if 'article_embeddings' in article:
+    key = article_key(article)
+    if key in article_store:
+        logger.info("Using locally stored embedding.")
+        return article_store.get(key)
+    if has_current_embedding(article):
         logger.info("Using existing embedding.")
-        return article['article_embeddings']
+        article_store.add(key, list(article['article_embeddings']), article.get('article_published_date', 0))
+        return article_store.get(key)
     
-    text = article['article_title'] + " "
-    text += article.get('article_summary', ' '.join(p['content'] for p in article['article_content'] if p['type'] == 'paragraph'))
-    
-    logger.info("Generating new embedding using OpenAI API.")
-    response = openai_client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text.strip(),
-        encoding_format="float",
-        dimensions=512
-    )
+    logger.info(f"Generating new embedding using the {get_embedder().name} backend.")
+    [embedding] = get_embedder().embed([get_article_text(article)])
     logger.info("Embedding generated successfully.")
-    return response.data[0].embedding
+    article_store.add(key, embedding, article.get('article_published_date', 0))
+    return article_store.get(key)
+
+def prefilter_articles(new_articles: List[Dict[str, Any]], existing_clusters: List[str]) -> List[Dict[str, Any]]:
+    local_backend = get_local_backend()
+    if local_backend is None:
+        return new_articles
+    prefilter_store = get_prefilter_store()
+    # An article related only to a cluster the local store does not know would be skipped, and that cluster never updated
+    unknown = [cluster_id for cluster_id in existing_clusters if cluster_id not in prefilter_store]
+    if unknown:
+        logger.warning(f"{len(unknown)} active clusters have no pre-filter entry, not pre-filtering this run.")
+        return new_articles
+    article_store = get_article_store()
+    
+    pending = [
+        i for i, article in enumerate(new_articles)
+        if article_key(article) not in article_store and not has_current_embedding(article)
+    ]
+    if not pending:
+        return new_articles
+    
+    logger.info(f"Pre-filtering {len(pending)} articles without an embedding using the local backend...")
+    local_embeddings = local_backend.embed([get_article_text(article) for article in new_articles])
+    article_similarities = local_embeddings[pending] @ local_embeddings.T
+    article_similarities[np.arange(len(pending)), pending] = -1
+    active_clusters = prefilter_store.ids_since(int(time.time()) - CLUSTER_WINDOW)
+    
+    skipped = set()
+    for row, i in enumerate(pending):
+        best_similarity = article_similarities[row].max(initial=-1)
+        if active_clusters:
+            [(_, cluster_similarity)] = prefilter_store.search(local_embeddings[i], k=1, vector_ids=active_clusters)
+            best_similarity = max(best_similarity, cluster_similarity)
+        if best_similarity < LOCAL_PREFILTER_THRESHOLD:
+            skipped.add(i)
+    
+    logger.info(f"{len(skipped)} articles are unrelated to any active cluster or new article, skipping them this run.")
+    return [article for i, article in enumerate(new_articles) if i not in skipped]
 
-def assign_to_clusters(new_articles: List[Dict[str, Any]], existing_clusters: List[Dict[str, Any]], similarity_threshold: float = 0.7) -> Tuple[List[Tuple[Dict[str, Any], str]], List[Dict[str, Any]]]:
+def update_prefilter_store(cluster_id: str, articles: List[Dict[str, Any]], timestamp: int):
+    prefilter_store = get_prefilter_store()
+    if prefilter_store is not None:
+        prefilter_store.add(cluster_id, get_local_backend().embed([get_cluster_text(articles)])[0], timestamp)
+
+def assign_to_clusters(new_articles: List[Dict[str, Any]], existing_clusters: List[str], similarity_threshold: float = 0.7) -> Tuple[List[Tuple[Dict[str, Any], str]], List[Dict[str, Any]]]:
     logger.info("Assigning new articles to existing clusters...")
     assigned_articles = []
     unassigned_articles = []
     
     for article in new_articles:
         article_embedding = get_article_embedding(article)
-        best_similarity, best_cluster = max(
-            ((1 - cosine(article_embedding, cluster['cluster_embedding']._value), cluster)
-             for cluster in existing_clusters),
-            key=lambda x: x[0]
-        )
+        [(best_cluster_id, best_similarity)] = get_cluster_store().search(article_embedding, k=1, vector_ids=existing_clusters)
         
         if best_similarity >= similarity_threshold:
-            assigned_articles.append((article, best_cluster['id']))
-            logger.info(f"Article {article['id']} assigned to cluster {best_cluster['id']} with similarity {best_similarity:.4f}")
+            assigned_articles.append((article, best_cluster_id))
+            logger.info(f"Article {article['id']} assigned to cluster {best_cluster_id} with similarity {best_similarity:.4f}")
         else:
             unassigned_articles.append(article)
             logger.info(f"Article {article['id']} not assigned to any cluster. Best similarity: {best_similarity:.4f}")
@@ -113,8 +321,9 @@ def generate_cluster_summary(articles: List[Dict[str, Any]]) -> Dict[str, str]:
     
     prompt = f"Krijo një artikull lajmesh të shkruar mirë dhe gjatë duke u bazuar një grup artikujsh të mëposhtëm.Përdor markdown. Mos lini detaje pa përfshirë. Sigurohu që artikulli të ketë një titull dhe një përmbledhje të qartë dhe të plotësuar. Titulli dhe përmbledhja duhet të jenë të bindshme dhe tërheqëse për lexuesit. Pergjigju ne formatin JSON me celsat 'cluster_title' dhe 'cluster_content'. 'cluster_title' dhe 'cluster_content' duhet te jene gjithmone te ndara nga njera tjetra duke mos pasur mbivendosje. :\n\n{combined_text}"
     
-    response = openai_client.chat.completions.create(
+    response = get_gateway().chat(
         model="gpt-4o-mini",
+        priority=PRIORITY_HIGH,
         messages=[
             {"role": "system", "content": "Ju jeni një gazetar virtual i talentuar,i paanshem, i cili është specializuar në shkrimin e artikujve lajmesh tërheqës dhe të plotë. Ju keni një stil shkrimi tërheqës dhe profesional. Pergjigju ne formatin JSON."},
             {"role": "user", "content": prompt}
@@ -127,152 +336,592 @@ def generate_cluster_summary(articles: List[Dict[str, Any]]) -> Dict[str, str]:
     logger.info("Cluster summary generated successfully.")
     return cluster_summary
 
+def get_cluster_text(articles: List[Dict[str, Any]]) -> str:
+    return "\n\n".join(get_article_text(article) for article in articles)
+
 def generate_cluster_embedding(articles: List[Dict[str, Any]]) -> List[float]:
     logger.info("Generating cluster embedding...")
-    combined_text = "\n\n".join([
-        f"{article['article_title']} {article.get('article_summary', ' '.join(p['content'] for p in article['article_content'] if p['type'] == 'paragraph'))}"
-        for article in articles
-    ])
-    
-    embedding_response = openai_client.embeddings.create(
-        model="text-embedding-3-small",
-        input=combined_text.strip(),
-        encoding_format="float",
-        dimensions=512
-    )
-    return embedding_response.data[0].embedding
+    [embedding] = get_embedder().embed([get_cluster_text(articles)], priority=PRIORITY_HIGH)
+    return embedding.tolist()
+
+def create_cluster_document(cluster_articles: List[Dict[str, Any]], journal: RunJournal, cluster_id: str = None) -> str:
+    from google.cloud.firestore_v1.vector import Vector
 
-def create_cluster_document(cluster_articles: List[Dict[str, Any]]) -> str:
     logger.info("Creating new cluster document...")
-    cluster_id = str(uuid.uuid4())
+    # A resumed plan keeps its cluster id even if some planned members have since been deleted
+    cluster_id = cluster_id or get_cluster_id(cluster_articles)
     current_timestamp = int(time.time())
     
-    article_refs = [db.collection('news_sources').document(article['source']).collection('articles').document(article['id']) for article in cluster_articles]
+    article_refs = [get_db().collection('news_sources').document(article['source']).collection('articles').document(article['id']) for article in cluster_articles]
     
-    cluster_summary = generate_cluster_summary(cluster_articles)
-    cluster_embedding = generate_cluster_embedding(cluster_articles)
+    cluster_summary = journal.cached(f'summary:{cluster_id}', lambda: generate_cluster_summary(cluster_articles))
+    cluster_embedding = journal.cached(f'embedding:{cluster_id}', lambda: generate_cluster_embedding(cluster_articles))
     cluster_data = {
-        f'articles_{current_timestamp}': article_refs,
+        'article_refs': article_refs,
+        'member_count': len(article_refs),
+        'first_seen': current_timestamp,
+        'last_seen': current_timestamp,
         'cluster_embedding': Vector(cluster_embedding),
+        'cluster_embedding_model': get_embedder().model_tag,
         'last_updated': current_timestamp,
         'cluster_title': cluster_summary['cluster_title'],
         'cluster_content': cluster_summary['cluster_content']
     }
     
-    db.collection('article_clusters').document(cluster_id).set(cluster_data)
+    batch = get_db().batch()
+    batch.set(get_db().collection('article_clusters').document(cluster_id), cluster_data)
+    get_cluster_index().write(batch, {cluster_id: get_cluster_index().entry(cluster_embedding, len(article_refs), current_timestamp, get_embedder().model_tag)})
+    batch.commit()
+    update_prefilter_store(cluster_id, cluster_articles, current_timestamp)
     logger.info(f"New cluster created with ID: {cluster_id}")
     return cluster_id
 def update_article_with_cluster(article: Dict[str, Any], cluster_id: str):
     logger.info(f"Updating article {article['id']} with cluster ID: {cluster_id}")
-    db.collection('news_sources').document(article['source']).collection('articles').document(article['id']).update({'cluster_id': cluster_id})
+    get_db().collection('news_sources').document(article['source']).collection('articles').document(article['id']).update({'cluster_id': cluster_id})
     logger.info("Article updated successfully.")
 
-def update_existing_cluster(cluster_id: str, new_article: Dict[str, Any]):
+def forget_cluster(cluster_id: str):
+    # Deleted outside of maintain (which already cleans up after itself), drop it from the index and the local stores
+    batch = get_db().batch()
+    get_cluster_index().write(batch, removed=[cluster_id])
+    batch.commit()
+    for store in (get_cluster_store(), get_prefilter_store()):
+        if store is not None:
+            store.remove([cluster_id])
+
+def update_existing_cluster(cluster_id: str, new_article: Dict[str, Any], journal: RunJournal) -> bool:
+    """Adds the article to the cluster. Returns False, without writing anything, if the cluster is gone."""
+    from firebase_admin import firestore
+    from google.cloud.firestore_v1.vector import Vector
+
     logger.info(f"Updating existing cluster: {cluster_id}")
-    cluster_ref = db.collection('article_clusters').document(cluster_id)
-    cluster_data = cluster_ref.get().to_dict()
+    cluster_ref = get_db().collection('article_clusters').document(cluster_id)
+    cluster_doc = cluster_ref.get(field_paths=['article_refs', 'member_count'])
+    if cluster_doc.exists and 'member_count' not in cluster_doc.to_dict():
+        cluster_doc = cluster_ref.get()
+        cluster_data = migrate_cluster(cluster_doc) if cluster_doc.exists else None
+    else:
+        cluster_data = cluster_doc.to_dict() if cluster_doc.exists else None
+    if cluster_data is None:
+        logger.warning(f"Cluster {cluster_id} no longer exists, not adding article {new_article['id']} to it.")
+        forget_cluster(cluster_id)
+        return False
     
-    new_article_ref = db.collection('news_sources').document(new_article['source']).collection('articles').document(new_article['id'])
+    new_article_ref = get_db().collection('news_sources').document(new_article['source']).collection('articles').document(new_article['id'])
     current_timestamp = int(time.time())
+    article_refs = cluster_data.get('article_refs', [])
     
-    if not any(new_article_ref in refs for refs in cluster_data.values() if isinstance(refs, list)):
+    membership_update = {}
+    member_count = cluster_data.get('member_count', len(article_refs))
+    if new_article_ref not in article_refs:
         logger.info("Adding new article reference to the cluster.")
-        timestamp_key = f'articles_{current_timestamp}'
-        cluster_data.setdefault(timestamp_key, []).append(new_article_ref)
+        membership_update = {
+            'article_refs': firestore.ArrayUnion([new_article_ref]),
+            'member_count': firestore.Increment(1),
+            'last_seen': current_timestamp
+        }
+        member_count += 1
     else:
         logger.info("Article reference already exists in the cluster. Skipping addition.")
     
     logger.info("Fetching all articles in the cluster...")
-    processed_article_ids = set()
-    all_articles = []
-    
-    for refs in cluster_data.values():
-        if isinstance(refs, list):
-            for ref in refs:
-                article_id = ref.id
-                if article_id not in processed_article_ids:
-                    article_info = get_article_info(ref)
-                    if article_info:
-                        all_articles.append(article_info)
-                        processed_article_ids.add(article_id)
-    
-    if new_article['id'] not in processed_article_ids:
+    all_articles = [article_info for article_info in map(get_article_info, article_refs) if article_info]
+    if new_article['id'] not in {article['id'] for article in all_articles}:
         all_articles.append(new_article)
     
-    cluster_summary = generate_cluster_summary(all_articles)
-    cluster_embedding = generate_cluster_embedding(all_articles)
+    update_key = f'{cluster_id}:{article_key(new_article)}'
+    cluster_summary = journal.cached(f'summary:{update_key}', lambda: generate_cluster_summary(all_articles))
+    cluster_embedding = journal.cached(f'embedding:{update_key}', lambda: generate_cluster_embedding(all_articles))
     
-    cluster_data.update({
+    batch = get_db().batch()
+    batch.update(cluster_ref, {
+        **membership_update,
         'cluster_embedding': Vector(cluster_embedding),
+        'cluster_embedding_model': get_embedder().model_tag,
         'last_updated': current_timestamp,
         'cluster_title': cluster_summary['cluster_title'],
         'cluster_content': cluster_summary['cluster_content']
     })
-    
-    cluster_ref.set(cluster_data)
+    get_cluster_index().write(batch, {cluster_id: get_cluster_index().entry(cluster_embedding, member_count, current_timestamp, get_embedder().model_tag)})
+    batch.commit()
+    update_prefilter_store(cluster_id, all_articles, current_timestamp)
     logger.info("Cluster updated successfully with new embedding, summary, and timestamp.")
+    return True
+
 def get_article_info(article_ref) -> Dict[str, Any]:
     logger.info(f"Fetching article info for {article_ref.id}")
     article_doc = article_ref.get()
     if article_doc.exists:
         article_data = article_doc.to_dict()
-        return {
+        article_info = {
             'article_title': article_data['article_title'],
             'article_content': article_data['article_content'],
             'article_summary': article_data.get('article_summary', ''),
+            'article_published_date': article_data.get('article_published_date', 0),
             'id': article_doc.id,
             'source': article_ref.parent.parent.id
         }
+        if 'article_embeddings' in article_data:
+            article_info['article_embeddings'] = article_data['article_embeddings']
+            article_info['article_embedding_model'] = get_stored_model_tag(article_data)
+        return article_info
     logger.info("Article not found.")
     return {}
 
-def main():
-    logger.info("Starting main clustering process...")
-    new_articles = get_new_articles()
-    if not new_articles:
-        logger.info("No new articles found. Exiting.")
-        return
+def plan_clustering(new_articles: List[Dict[str, Any]]) -> Dict[str, Any]:
+    from sklearn.cluster import DBSCAN
 
     existing_clusters = get_existing_clusters()
+    new_articles = prefilter_articles(new_articles, existing_clusters)
     
     if existing_clusters:
         logger.info("First stage: Assigning to existing clusters")
         assigned_articles, unassigned_articles = assign_to_clusters(new_articles, existing_clusters)
-        
-        for article, cluster_id in assigned_articles:
-            update_article_with_cluster(article, cluster_id)
-            update_existing_cluster(cluster_id, article)
-        
-        logger.info(f"{len(assigned_articles)} articles assigned to existing clusters.")
     else:
         logger.info("No existing clusters found.")
-        unassigned_articles = new_articles
+        assigned_articles, unassigned_articles = [], new_articles
     
     logger.info("Second stage: Clustering remaining articles")
+    new_clusters = []
     if unassigned_articles:
-        unassigned_embeddings = [get_article_embedding(article) for article in unassigned_articles]
+        for article in unassigned_articles:
+            get_article_embedding(article)
+        unassigned_embeddings = get_article_store().matrix([article_key(article) for article in unassigned_articles])
         clusters = DBSCAN(eps=0.2, min_samples=2, metric='cosine').fit_predict(unassigned_embeddings)
         
         for cluster_label in set(clusters) - {-1}:
             cluster_articles = [article for article, label in zip(unassigned_articles, clusters) if label == cluster_label]
             if len(cluster_articles) >= 2:
-                cluster_id = create_cluster_document(cluster_articles)
-                for article in cluster_articles:
+                new_clusters.append([get_cluster_id(cluster_articles), [article_key(article) for article in cluster_articles]])
+    
+    return {
+        'assignments': [[article_key(article), cluster_id] for article, cluster_id in assigned_articles],
+        'new_clusters': new_clusters,
+        'unassigned_count': len(unassigned_articles)
+    }
+
+def main(hours: int = 24, journal_path: str = CLUSTER_JOURNAL_PATH):
+    logger.info("Starting main clustering process...")
+    journal = RunJournal(journal_path)
+    new_articles = get_new_articles(hours)
+    articles_by_key = {article_key(article): article for article in new_articles}
+    
+    plan = journal.get('plan')
+    if plan is not None:
+        # A step that keeps failing would otherwise block every later run
+        attempts = journal.get('resume_attempts', 0) + 1
+        if attempts > CLUSTER_RESUME_ATTEMPTS:
+            logger.error(f"Abandoning the interrupted clustering run after {attempts - 1} failed resumes, its journal is kept in {journal_path}.last.")
+            journal.complete()
+            journal = RunJournal(journal_path)
+            plan = None
+        else:
+            journal.put('resume_attempts', attempts)
+            logger.info(f"Resuming interrupted clustering run (attempt {attempts}): {len(journal.done)} writes already applied.")
+    if plan is None:
+        if not new_articles:
+            logger.info("No new articles found. Exiting.")
+            journal.close()
+            return
+        plan = journal.put('plan', plan_clustering(new_articles))
+    
+    def resolve_article(key: str) -> Dict[str, Any]:
+        # Articles already written by the interrupted run are no longer returned as new
+        if key not in articles_by_key:
+            articles_by_key[key] = get_article_info(get_article_ref(key))
+        return articles_by_key[key]
+    
+    assigned_count = 0
+    for key, cluster_id in plan['assignments']:
+        if journal.is_done(f'article:{key}') and journal.is_done(f'cluster_update:{cluster_id}:{key}'):
+            continue
+        article = resolve_article(key)
+        if not article:
+            logger.warning(f"Article {key} no longer exists, skipping it.")
+            journal.mark_done(f'article:{key}')
+            journal.mark_done(f'cluster_update:{cluster_id}:{key}')
+            continue
+        if not journal.is_done(f'cluster_update:{cluster_id}:{key}'):
+            if not update_existing_cluster(cluster_id, article, journal):
+                # Its cluster was merged away or deleted: the article stays unclustered and the next run plans it again
+                if journal.is_done(f'article:{key}'):
+                    update_article_with_cluster(article, -1)
+                journal.mark_done(f'article:{key}')
+                journal.mark_done(f'cluster_update:{cluster_id}:{key}')
+                continue
+            journal.mark_done(f'cluster_update:{cluster_id}:{key}')
+        if not journal.is_done(f'article:{key}'):
+            update_article_with_cluster(article, cluster_id)
+            journal.mark_done(f'article:{key}')
+        assigned_count += 1
+    logger.info(f"{assigned_count} articles assigned to existing clusters.")
+    
+    for cluster_id, keys in plan['new_clusters']:
+        if not journal.is_done(f'create:{cluster_id}'):
+            cluster_articles = [article for article in map(resolve_article, keys) if article]
+            if len(cluster_articles) < 2:
+                logger.warning(f"Only {len(cluster_articles)} articles of planned cluster {cluster_id} still exist, not creating it.")
+                for key in keys:
+                    journal.mark_done(f'article:{key}')
+                journal.mark_done(f'create:{cluster_id}')
+                continue
+            create_cluster_document(cluster_articles, journal, cluster_id)
+            journal.mark_done(f'create:{cluster_id}')
+        for key in keys:
+            if not journal.is_done(f'article:{key}'):
+                article = resolve_article(key)
+                if article:
                     update_article_with_cluster(article, cluster_id)
-        
-        logger.info(f"{len(set(clusters)) - (1 if -1 in clusters else 0)} new clusters created from {len(unassigned_articles)} unassigned articles.")
+                journal.mark_done(f'article:{key}')
+    
+    if plan['new_clusters']:
+        logger.info(f"{len(plan['new_clusters'])} new clusters created from {plan['unassigned_count']} unassigned articles.")
     else:
         logger.info("No new clusters created.")
+    
+    if not journal.is_done('story_feed'):
+        changed_cluster_ids = [cluster_id for _, cluster_id in plan['assignments']] + [cluster_id for cluster_id, _ in plan['new_clusters']]
+        if changed_cluster_ids:
+            get_story_feed().refresh(changed_cluster_ids)
+        journal.mark_done('story_feed')
 
+    journal.complete()
+    prune_vector_stores()
     logger.info("Clustering process completed.")
 
-def run_scheduler():
-    logger.info("Starting the scheduler. The script will run every hour.")
-    schedule.every(10).seconds.do(main)
+def prune_vector_stores():
+    # Articles are only needed while their clusters can still change
+    time_threshold = int(time.time()) - CLUSTER_WINDOW
+    get_article_store().remove([key for key, updated in get_article_store().updated.items() if updated < time_threshold])
+    cluster_stores = [store for store in (get_cluster_store(), get_prefilter_store()) if store is not None]
+    for store in cluster_stores:
+        store.remove([cluster_id for cluster_id, updated in store.updated.items() if updated < time_threshold])
+    
+    for store in [get_article_store()] + cluster_stores:
+        if store.rows > 2 * len(store) + 1000:
+            logger.info(f"Compacting vector store at {store.path}...")
+            store.compact()
+
+def migrate_cluster(cluster_doc, writer=None) -> Dict[str, Any]:
+    from firebase_admin import firestore
+
+    cluster_data = cluster_doc.to_dict() or {}
+    legacy_keys = get_legacy_article_keys(cluster_data)
+    article_refs = get_cluster_article_refs(cluster_data)
+    
+    migrated = {
+        'article_refs': article_refs,
+        'member_count': len(article_refs),
+        'first_seen': get_cluster_first_seen(cluster_data),
+        'last_seen': get_cluster_last_seen(cluster_data)
+    }
+    update = migrated | {key: firestore.DELETE_FIELD for key in legacy_keys}
+    if writer is None:
+        cluster_doc.reference.update(update)
+    else:
+        writer.update(cluster_doc.reference, update)
+    logger.info(f"Migrated cluster {cluster_doc.id} to the compact membership layout with {len(article_refs)} articles.")
+    return migrated
+
+def migrate_cluster_membership() -> int:
+    logger.info("Migrating clusters to the compact membership layout...")
+    migrated_count = 0
+    writer = get_db().bulk_writer()
+    for cluster_doc in get_db().collection('article_clusters').stream():
+        cluster_data = cluster_doc.to_dict()
+        if 'member_count' in cluster_data and not get_legacy_article_keys(cluster_data):
+            continue
+        migrate_cluster(cluster_doc, writer)
+        migrated_count += 1
+    writer.close()
+    logger.info(f"Migrated {migrated_count} clusters.")
+    return migrated_count
+
+def rewrite_cluster(cluster_id: str, articles: List[Dict[str, Any]], writer, first_seen: int = None) -> Dict[str, Any]:
+    from google.cloud.firestore_v1.vector import Vector
+
+    logger.info(f"Rewriting cluster {cluster_id} with {len(articles)} articles...")
+    current_timestamp = int(time.time())
+    article_refs = [get_db().collection('news_sources').document(article['source']).collection('articles').document(article['id']) for article in articles]
+    
+    cluster_summary = generate_cluster_summary(articles)
+    cluster_embedding = generate_cluster_embedding(articles)
+    writer.set(get_db().collection('article_clusters').document(cluster_id), {
+        'article_refs': article_refs,
+        'member_count': len(article_refs),
+        'first_seen': first_seen or current_timestamp,
+        'last_seen': current_timestamp,
+        'cluster_embedding': Vector(cluster_embedding),
+        'cluster_embedding_model': get_embedder().model_tag,
+        'last_updated': current_timestamp,
+        'cluster_title': cluster_summary['cluster_title'],
+        'cluster_content': cluster_summary['cluster_content']
+    })
+    get_cluster_store().add(cluster_id, cluster_embedding, current_timestamp)
+    update_prefilter_store(cluster_id, articles, current_timestamp)
+    # Index entries are written once the bulk writer is done, a BulkWriter batch takes one write per document
+    return get_cluster_index().entry(cluster_embedding, len(article_refs), current_timestamp, get_embedder().model_tag)
+
+def merge_similar_clusters(similarity_threshold: float = CLUSTER_MERGE_THRESHOLD) -> int:
+    logger.info("Looking for clusters to merge...")
+    cluster_ids = get_existing_clusters()
+    if len(cluster_ids) < 2:
+        return 0
     
+    centroids = get_cluster_store().matrix(cluster_ids)
+    similarities = np.triu(centroids @ centroids.T, k=1)
+    first, second = np.nonzero(similarities >= similarity_threshold)
+    order = np.argsort(-similarities[first, second])
+    
+    # Every cluster is merged straight into its most similar survivor, never through a chain of clusters
+    absorbed_into = {}
+    for i, j in zip(first[order], second[order]):
+        if cluster_ids[i] in absorbed_into or cluster_ids[j] in absorbed_into:
+            continue
+        survivor, absorbed = sorted((cluster_ids[i], cluster_ids[j]), key=lambda cluster_id: get_cluster_store().updated[cluster_id], reverse=True)
+        if absorbed in absorbed_into.values():
+            continue
+        absorbed_into[absorbed] = survivor
+    
+    groups = {}
+    for absorbed, survivor in absorbed_into.items():
+        groups.setdefault(survivor, []).append(absorbed)
+    
+    index_entries = {}
+    writer = get_db().bulk_writer()
+    for survivor, absorbed_ids in groups.items():
+        logger.info(f"Merging clusters {absorbed_ids} into {survivor}")
+        articles = {}
+        first_seen = []
+        for cluster_id in [survivor] + absorbed_ids:
+            cluster_data = get_db().collection('article_clusters').document(cluster_id).get().to_dict() or {}
+            first_seen.append(get_cluster_first_seen(cluster_data))
+            for ref in get_cluster_article_refs(cluster_data):
+                if ref.path not in articles:
+                    article_info = get_article_info(ref)
+                    if article_info:
+                        articles[ref.path] = article_info
+        
+        if not articles:
+            continue
+        index_entries[survivor] = rewrite_cluster(survivor, list(articles.values()), writer, first_seen=min(first_seen))
+        for article in articles.values():
+            writer.update(get_db().collection('news_sources').document(article['source']).collection('articles').document(article['id']), {'cluster_id': survivor})
+        for cluster_id in absorbed_ids:
+            writer.delete(get_db().collection('article_clusters').document(cluster_id))
+        get_cluster_store().remove(absorbed_ids)
+        if get_prefilter_store() is not None:
+            get_prefilter_store().remove(absorbed_ids)
+    writer.close()
+    if groups:
+        batch = get_db().batch()
+        get_cluster_index().write(batch, index_entries, absorbed_into.keys())
+        batch.commit()
+        get_story_feed().refresh(groups.keys(), absorbed_into.keys())
+    
+    logger.info(f"Merged {len(absorbed_into)} clusters into {len(groups)} surviving clusters.")
+    return len(absorbed_into)
+
+def split_drifted_clusters(similarity_threshold: float = CLUSTER_SPLIT_THRESHOLD) -> int:
+    from sklearn.cluster import DBSCAN
+
+    logger.info("Looking for clusters whose articles have drifted apart...")
+    split_count = 0
+    index_entries = {}
+    writer = get_db().bulk_writer()
+    
+    for cluster_id in get_existing_clusters():
+        cluster_data = get_db().collection('article_clusters').document(cluster_id).get().to_dict() or {}
+        articles = [article_info for article_info in map(get_article_info, get_cluster_article_refs(cluster_data)) if article_info]
+        if len(articles) < 4:
+            continue
+        
+        embeddings = np.array([get_article_embedding(article) for article in articles])
+        centroid = embeddings.mean(axis=0)
+        centroid /= np.linalg.norm(centroid)
+        if (embeddings @ centroid).min() >= similarity_threshold:
+            continue
+        
+        labels = DBSCAN(eps=0.2, min_samples=2, metric='cosine').fit_predict(embeddings)
+        groups = sorted(
+            ([article for article, label in zip(articles, labels) if label == group_label] for group_label in set(labels) - {-1}),
+            key=len,
+            reverse=True
+        )
+        if len(groups) < 2:
+            continue
+        
+        # The largest group and the unclustered articles stay in the original cluster
+        logger.info(f"Splitting cluster {cluster_id} into {len(groups)} clusters")
+        moved_ids = set()
+        for group in groups[1:]:
+            new_cluster_id = get_cluster_id(group)
+            index_entries[new_cluster_id] = rewrite_cluster(new_cluster_id, group, writer)
+            for article in group:
+                writer.update(get_db().collection('news_sources').document(article['source']).collection('articles').document(article['id']), {'cluster_id': new_cluster_id})
+                moved_ids.add(article['id'])
+        index_entries[cluster_id] = rewrite_cluster(cluster_id, [article for article in articles if article['id'] not in moved_ids], writer, first_seen=get_cluster_first_seen(cluster_data))
+        split_count += 1
+    
+    writer.close()
+    if index_entries:
+        batch = get_db().batch()
+        get_cluster_index().write(batch, index_entries)
+        batch.commit()
+        get_story_feed().refresh(index_entries.keys())
+    logger.info(f"Split {split_count} clusters.")
+    return split_count
+
+def reembed_clusters(backend) -> int:
+    """Re-embeds the active clusters whose centroid came from another model than `backend`'s.
+
+    Part of backfill-embeddings, so clusters keep being matched once the
+    clusterer embeds with the new model. Returns the number of clusters
+    re-embedded.
+    """
+    from google.cloud.firestore_v1.vector import Vector
+
+    time_threshold = int(time.time()) - CLUSTER_WINDOW
+    cluster_index = get_cluster_index()
+    index = cluster_index.load()
+    if index is None:
+        index = cluster_index.rebuild(time_threshold)
+    stale = {cluster_id: entry for cluster_id, entry in index.items() if entry[2] >= time_threshold and entry[3] != backend.model_tag}
+    logger.info(f"Re-embedding {len(stale)} active clusters with {backend.model_tag}...")
+    
+    index_entries = {}
+    writer = get_db().bulk_writer()
+    for cluster_id, (_, member_count, last_updated, _) in stale.items():
+        cluster_ref = get_db().collection('article_clusters').document(cluster_id)
+        cluster_data = cluster_ref.get().to_dict()
+        if not cluster_data:
+            continue
+        articles = [article_info for article_info in map(get_article_info, get_cluster_article_refs(cluster_data)) if article_info]
+        if not articles:
+            continue
+        [embedding] = backend.embed([get_cluster_text(articles)], priority=PRIORITY_LOW)
+        embedding = embedding.tolist()
+        writer.update(cluster_ref, {'cluster_embedding': Vector(embedding), 'cluster_embedding_model': backend.model_tag})
+        # last_updated is kept, a new centroid does not keep a cluster active for longer
+        index_entries[cluster_id] = cluster_index.entry(embedding, member_count, last_updated, backend.model_tag)
+    writer.close()
+    if index_entries:
+        batch = get_db().batch()
+        cluster_index.write(batch, index_entries)
+        batch.commit()
+        # Its last_updated is unchanged, so a centroid the store may still hold from an earlier run of this model would be kept
+        if backend.model_tag == get_embedder().model_tag:
+            get_cluster_store().remove(list(index_entries))
+    logger.info(f"Re-embedded {len(index_entries)} clusters.")
+    return len(index_entries)
+
+def maintain_clusters(split: bool = False):
+    logger.info("Starting cluster maintenance...")
+    merge_similar_clusters()
+    if split:
+        split_drifted_clusters()
+    logger.info("Cluster maintenance completed.")
+
+def run_daemon(interval: int = CLUSTER_INTERVAL):
+    import schedule
+
+    logger.info(f"Starting the scheduler. Clustering will run every {interval} seconds.")
+    
+    def run():
+        # A failed run is resumed from its journal by the next one
+        try:
+            main()
+        except Exception:
+            logger.exception("Clustering run failed.")
+    
+    schedule.every(interval).seconds.do(run)
     while True:
         schedule.run_pending()
         time.sleep(1)
 
+def check_startup(budget: float = STARTUP_BUDGET) -> bool:
+    """Imports this module in a fresh interpreter and checks it stays fast and light."""
+    code = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import cluster\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"loaded = [name for name in {DEFERRED_MODULES!r} if name in sys.modules]\n"
+        "print(json.dumps({'elapsed': elapsed, 'loaded': loaded}))\n"
+    )
+    output = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    
+    ok = result['elapsed'] <= budget and not result['loaded']
+    logger.info(f"Importing cluster.py took {result['elapsed'] * 1000:.0f} ms (budget {budget * 1000:.0f} ms).")
+    if result['loaded']:
+        logger.error(f"Deferred modules imported at startup: {', '.join(result['loaded'])}")
+    if result['elapsed'] > budget:
+        logger.error("Startup is over budget.")
+    return ok
+
 if __name__ == "__main__":
-    run_scheduler()
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Cluster scraped articles.")
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.add_parser('run-once', help="Cluster the new articles once and exit, e.g. from cron.")
+    daemon_parser = commands.add_parser('daemon', aliases=['schedule'], help="Cluster new articles every --interval seconds (the default).")
+    daemon_parser.add_argument('--interval', type=int, default=CLUSTER_INTERVAL)
+    backfill_parser = commands.add_parser('backfill', help="Cluster the unclustered articles of a longer window once.")
+    backfill_parser.add_argument('--hours', type=int, default=7 * 24, help="How far back to look for unclustered articles.")
+    maintain_parser = commands.add_parser('maintain', help="Merge clusters of the same story, and optionally split drifted ones.")
+    maintain_parser.add_argument('--split', action='store_true', help="Also split clusters whose articles have drifted apart.")
+    commands.add_parser('migrate', help="Move clusters to the compact membership layout.")
+    commands.add_parser('feed', help="Rebuild the story feed from all active clusters.")
+    commands.add_parser('index', help="Rebuild the cluster index.")
+    embeddings_parser = commands.add_parser('backfill-embeddings', help="Re-embed stored articles and active clusters in bulk, e.g. after a model change.")
+    embeddings_parser.add_argument('--model', help="OpenAI embedding model, instead of the configured backend (default EMBEDDING_MODEL).")
+    embeddings_parser.add_argument('--dimensions', type=int, help="Embedding dimensions for --model (default EMBEDDING_DIMENSIONS).")
+    embeddings_parser.add_argument('--force', action='store_true', help="Also re-embed articles already embedded with this model.")
+    embeddings_parser.add_argument('--hours', type=int, help="Only articles published in the last --hours.")
+    embeddings_parser.add_argument('--source', action='append', help="Only this news source (repeatable).")
+    embeddings_parser.add_argument('--workers', type=int, default=8, help="Concurrent embedding requests.")
+    embeddings_parser.add_argument('--batch-size', type=int, default=256, help="Articles per embedding request.")
+    embeddings_parser.add_argument('--page-size', type=int, default=2048, help="Articles read per Firestore page.")
+    startup_parser = commands.add_parser('startup-check', help="Fail if importing this CLI gets slow or imports heavy modules.")
+    startup_parser.add_argument('--budget', type=float, default=STARTUP_BUDGET, help="Maximum import time in seconds.")
+    args = parser.parse_args()
+
+    if args.command == 'run-once':
+        main()
+    elif args.command == 'backfill':
+        # Its own journal, so a backfill never resumes, or is resumed by, a regular run
+        root, ext = os.path.splitext(CLUSTER_JOURNAL_PATH)
+        main(hours=args.hours, journal_path=f'{root}-backfill{ext}')
+    elif args.command == 'maintain':
+        maintain_clusters(split=args.split)
+    elif args.command == 'migrate':
+        migrate_cluster_membership()
+    elif args.command == 'feed':
+        get_story_feed().refresh(get_existing_clusters())
+    elif args.command == 'index':
+        get_cluster_index().rebuild(int(time.time()) - CLUSTER_WINDOW)
+    elif args.command == 'backfill-embeddings':
+        from newsify.backfill import EmbeddingBackfill
+        from newsify.embeddings import OpenAIEmbeddingBackend
+
+        if args.model or args.dimensions:
+            backend = OpenAIEmbeddingBackend(get_gateway(), model=args.model or EMBEDDING_MODEL, dimensions=args.dimensions or EMBEDDING_DIMENSIONS)
+        else:
+            backend = get_embedder()
+        EmbeddingBackfill(
+            get_db(), backend,
+            journal_path=os.path.join(os.path.dirname(CLUSTER_JOURNAL_PATH), 'backfill-embeddings.jsonl'),
+            workers=args.workers,
+            batch_size=args.batch_size,
+            page_size=args.page_size,
+            force=args.force,
+            hours=args.hours
+        ).run(sources=args.source)
+        # Centroids are embedded from the articles' texts, so the active clusters follow whatever articles were selected
+        reembed_clusters(backend)
+    elif args.command == 'startup-check':
+        sys.exit(0 if check_startup(args.budget) else 1)
+    else:
+        run_daemon(getattr(args, 'interval', CLUSTER_INTERVAL))
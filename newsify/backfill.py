@@ -0,0 +1,215 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .embeddings import get_article_text
+from .journal import RunJournal
+from .openai_gateway import PRIORITY_LOW
+
+logger = logging.getLogger(__name__)
+
+ARTICLE_FIELDS = ['article_title', 'article_summary', 'article_content', 'article_published_date', 'article_embedding_model']
+MAX_INPUT_TOKENS = 8000
+WRITE_ATTEMPTS = 5
+# OpenAI rejects embedding requests over 300k tokens in total, and the gateway's buckets cannot hold back requests over a minute's budget
+MAX_REQUEST_TOKENS = 300000
+
+
+def iter_pages(source_ref, page_size, start_after=None):
+    """Pages of article snapshots in document id order, so a cursor is just the last id."""
+    query = source_ref.collection('articles').order_by('__name__').select(ARTICLE_FIELDS).limit(page_size)
+    while True:
+        page_query = query.start_after({'__name__': start_after}) if start_after else query
+        page = list(page_query.stream())
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        start_after = page[-1].id
+
+
+def prefetch(pages, depth=2):
+    """Reads the next pages in the background while the current one is embedded."""
+    buffer = queue.Queue(maxsize=depth)
+    done = object()
+
+    def produce():
+        try:
+            for page in pages:
+                buffer.put(page)
+        except BaseException as e:
+            buffer.put(e)
+        buffer.put(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        page = buffer.get()
+        if page is done:
+            return
+        if isinstance(page, BaseException):
+            raise page
+        yield page
+
+
+class EmbeddingBackfill:
+    """Re-embeds stored articles in bulk, resumable through a journal.
+
+    Articles are streamed per source in pages, their texts embedded in
+    multi-input batches by a pool of workers (the OpenAI gateway's buckets
+    keep them within the rate limits, at backfill priority) and written back
+    with a BulkWriter. Through OpenAI a batch also stays within a token
+    budget per request. Once every write of a page is confirmed the last
+    article id is journaled, so an interrupted backfill resumes after the
+    last page it wrote; a page with failed writes stops the backfill. Each article records the backend, model and dimensions of its
+    embedding in `article_embedding_model`; articles already embedded with
+    the target model are skipped unless `force` is set.
+    """
+
+    def __init__(self, db, backend, journal_path, workers=8, batch_size=256, page_size=2048, force=False, hours=None):
+        self.db = db
+        self.backend = backend
+        self.journal_path = journal_path
+        self.workers = workers
+        self.batch_size = batch_size
+        self.page_size = page_size
+        self.force = force
+        self.hours = hours
+        self.since = None
+        self.gateway = getattr(backend, 'gateway', None)
+        self.batch_tokens = None
+        if self.gateway is not None:
+            limits = self.gateway.rate_limits.get(backend.model)
+            self.batch_tokens = min(MAX_REQUEST_TOKENS, limits['tpm']) if limits else MAX_REQUEST_TOKENS
+
+    def wants(self, data):
+        if self.since is not None and (data.get('article_published_date') or 0) < self.since:
+            return False
+        return self.force or data.get('article_embedding_model') != self.backend.model_tag
+
+    def get_text(self, data):
+        """Returns the text to embed and its token count (0 without the OpenAI gateway)."""
+        # Imported and very old articles may lack fields the crawler always sets today
+        text = get_article_text({
+            'article_title': data.get('article_title') or '',
+            'article_summary': data.get('article_summary'),
+            'article_content': data.get('article_content') or []
+        })
+        if not text or self.gateway is None:
+            return text, 0
+        token_count = self.gateway.count_tokens(text)
+        if token_count > MAX_INPUT_TOKENS:
+            encoding = self.gateway.encoding
+            text = encoding.decode(encoding.encode(text, disallowed_special=())[:MAX_INPUT_TOKENS])
+            token_count = MAX_INPUT_TOKENS
+        return text, token_count
+
+    def make_batches(self, articles):
+        """Splits (article, text, token count) entries into batches within the size and token budget."""
+        batches = []
+        batch = []
+        batch_tokens = 0
+        for article, text, token_count in articles:
+            if batch and (len(batch) == self.batch_size or (self.batch_tokens and batch_tokens + token_count > self.batch_tokens)):
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+            batch.append((article, text))
+            batch_tokens += token_count
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def embed_batch(self, batch):
+        articles, texts = zip(*batch)
+        embeddings = self.backend.embed(list(texts), priority=PRIORITY_LOW)
+        return list(zip(articles, embeddings))
+
+    def run(self, sources=None):
+        from google.cloud.firestore_v1.vector import Vector
+
+        journal = RunJournal(self.journal_path)
+        options = {'model': self.backend.model_tag, 'force': self.force, 'hours': self.hours}
+        if journal.resumed and journal.get('options') != options:
+            logger.warning("The interrupted backfill used other options, starting over.")
+            journal.complete()
+            journal = RunJournal(self.journal_path)
+        journal.put('options', options)
+        # A resumed backfill keeps the window it started with, or the articles it selects would shift
+        if self.hours is not None and journal.get('since') is None:
+            journal.put('since', int(time.time()) - self.hours * 60 * 60)
+        self.since = journal.get('since')
+
+        start = time.time()
+        totals = {'read': 0, 'embedded': 0}
+        # Paths of the current page's writes not yet confirmed; the writer calls back from its own threads
+        unconfirmed = set()
+        lock = threading.Lock()
+
+        def on_write_result(reference, result, bulk_writer):
+            with lock:
+                unconfirmed.discard(reference.path)
+
+        def on_write_error(error, bulk_writer):
+            if error.attempts < WRITE_ATTEMPTS:
+                return True
+            logger.error(f"Writing the embedding of {error.operation.reference.path} failed: {error.message}")
+            return False
+
+        writer = self.db.bulk_writer()
+        writer.on_write_result(on_write_result)
+        writer.on_write_error(on_write_error)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for source in self.db.collection('news_sources').stream():
+                if sources and source.id not in sources:
+                    continue
+                if journal.is_done(f'source:{source.id}'):
+                    continue
+                cursor = journal.get(f'cursor:{source.id}')
+                if cursor:
+                    logger.info(f"Resuming {source.id} after article {cursor}.")
+
+                for page in prefetch(iter_pages(source.reference, self.page_size, cursor)):
+                    articles = []
+                    for article in page:
+                        data = article.to_dict()
+                        if not self.wants(data):
+                            continue
+                        text, token_count = self.get_text(data)
+                        if text:
+                            articles.append((article, text, token_count))
+                    batches = self.make_batches(articles)
+                    for results in pool.map(self.embed_batch, batches):
+                        for article, embedding in results:
+                            with lock:
+                                unconfirmed.add(article.reference.path)
+                            writer.update(article.reference, {
+                                'article_embeddings': Vector([float(value) for value in embedding]),
+                                'article_embedding_model': self.backend.model_tag
+                            })
+                    # The cursor only moves past articles whose writes are applied
+                    writer.flush()
+                    if unconfirmed:
+                        writer.close()
+                        journal.close()
+                        raise RuntimeError(
+                            f"{len(unconfirmed)} embedding writes failed on a page of {source.id}, "
+                            f"rerun the backfill to resume before it."
+                        )
+                    journal.put(f'cursor:{source.id}', page[-1].id)
+
+                    totals['read'] += len(page)
+                    totals['embedded'] += len(articles)
+                    elapsed = time.time() - start
+                    logger.info(
+                        f"{source.id}: {totals['embedded']}/{totals['read']} articles embedded so far, "
+                        f"{totals['embedded'] / max(elapsed, 1e-9):.1f} articles/s."
+                    )
+                journal.mark_done(f'source:{source.id}')
+        writer.close()
+
+        journal.complete()
+        logger.info(f"Backfill complete: {totals['embedded']} of {totals['read']} articles embedded in {time.time() - start:.0f}s.")
+        return totals
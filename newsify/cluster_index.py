@@ -0,0 +1,132 @@
+import hashlib
+import logging
+import time
+
+import numpy as np
+
+from .embeddings import legacy_model_tag
+
+logger = logging.getLogger(__name__)
+
+MAX_SHARD_BYTES = 1024 * 1024  # Firestore's document size limit
+SHARD_WARNING_FRACTION = 0.8
+
+
+def shard_size(clusters):
+    """Firestore's storage size of a shard document holding `clusters`.
+
+    Field names count their UTF-8 length plus one, bytes and strings their
+    length plus one, integers eight bytes, and a document 32 bytes on top
+    of its name.
+    """
+    size = 32 + len('cluster_index/shard_00') + len('clusters') + 1 + len('updated') + 1 + 8 + len('shard_count') + 1 + 8
+    for cluster_id, entry in clusters.items():
+        size += len(cluster_id) + 1
+        size += len('centroid') + 1 + len(entry['centroid']) + 1
+        size += len('model') + 1 + len(entry.get('model') or '') + 1
+        size += len('member_count') + 1 + 8 + len('last_updated') + 1 + 8
+    return size
+
+
+class ClusterIndex:
+    """A compact copy of what cluster assignment needs, in `cluster_index/shard_<n>` documents.
+
+    Every active cluster is one map entry in the shard its id hashes to:
+    the centroid as float32 bytes, the model that embedded it, the member
+    count and `last_updated`. The
+    whole active set loads with a single `get_all` of the shards, whatever
+    the size of the summaries and member lists in `article_clusters`, and
+    deleted clusters disappear from it, which a query on `last_updated`
+    cannot tell. At 512 dimensions a shard holds about 480 clusters within
+    Firestore's 1 MiB document limit. A full shard fails the batch of every
+    cluster change hashed to it, so loading the index warns once a shard
+    passes 80% of the limit. Every shard records the shard count it was
+    written with; after a change of the count ids hash to other shards, so
+    the index is rebuilt instead of being read.
+    """
+
+    def __init__(self, db, shards=16):
+        self.db = db
+        self.collection = db.collection('cluster_index')
+        self.shards = shards
+
+    def shard_of(self, cluster_id):
+        return int(hashlib.sha1(cluster_id.encode('utf-8')).hexdigest()[:8], 16) % self.shards
+
+    def shard_ref(self, shard):
+        return self.collection.document(f'shard_{shard:02d}')
+
+    @staticmethod
+    def entry(embedding, member_count, last_updated, model):
+        return {
+            'centroid': np.asarray(embedding, dtype=np.float32).tobytes(),
+            'model': model,
+            'member_count': member_count,
+            'last_updated': last_updated
+        }
+
+    def write(self, batch, entries=None, removed=()):
+        """Adds `entries` (cluster id -> entry) and drops `removed` ids, with one write per shard.
+
+        Writes go through `batch` alongside the cluster documents they mirror.
+        """
+        from firebase_admin import firestore
+
+        updates = {}
+        for cluster_id, entry in (entries or {}).items():
+            updates.setdefault(self.shard_of(cluster_id), {})[cluster_id] = entry
+        for cluster_id in removed:
+            updates.setdefault(self.shard_of(cluster_id), {})[cluster_id] = firestore.DELETE_FIELD
+        for shard, clusters in updates.items():
+            batch.set(self.shard_ref(shard), {'clusters': clusters, 'updated': int(time.time()), 'shard_count': self.shards}, merge=True)
+
+    def load(self):
+        """Returns {cluster id: (centroid, member count, last_updated, model)}, or None if the index must be (re)built."""
+        shards = [shard for shard in self.db.get_all([self.shard_ref(shard) for shard in range(self.shards)]) if shard.exists]
+        if not shards:
+            return None
+        if any(shard.to_dict().get('shard_count') != self.shards for shard in shards):
+            logger.warning(f"The cluster index was written with another shard count than {self.shards}, rebuilding it.")
+            return None
+        clusters = {}
+        for shard in shards:
+            entries = shard.to_dict().get('clusters') or {}
+            self.check_size(shard.id, entries)
+            for cluster_id, entry in entries.items():
+                centroid = np.frombuffer(entry['centroid'], dtype=np.float32)
+                clusters[cluster_id] = (centroid, entry['member_count'], entry['last_updated'], entry.get('model') or legacy_model_tag(len(centroid)))
+        return clusters
+
+    def check_size(self, shard_id, entries):
+        size = shard_size(entries)
+        if size >= SHARD_WARNING_FRACTION * MAX_SHARD_BYTES:
+            logger.warning(
+                f"Cluster index {shard_id} holds {len(entries)} clusters, {size / MAX_SHARD_BYTES:.0%} of Firestore's document limit. "
+                f"Raise CLUSTER_INDEX_SHARDS and run `python cluster.py index` before cluster writes start failing."
+            )
+
+    def rebuild(self, since):
+        """Rewrites the index from the clusters updated since `since`, reading only the fields it keeps."""
+        from google.cloud.firestore_v1.base_query import FieldFilter
+
+        logger.info("Building the cluster index from article_clusters...")
+        query = (self.db.collection('article_clusters')
+                 .where(filter=FieldFilter("last_updated", ">=", since))
+                 .select(['cluster_embedding', 'cluster_embedding_model', 'member_count', 'last_updated']))
+        shards = {shard: {} for shard in range(self.shards)}
+        clusters = {}
+        for cluster in query.stream():
+            centroid = np.asarray(cluster.get('cluster_embedding')._value, dtype=np.float32)
+            # Clusters not yet migrated to the compact layout are counted when they are next updated
+            member_count = cluster.to_dict().get('member_count', 0)
+            model = cluster.to_dict().get('cluster_embedding_model') or legacy_model_tag(len(centroid))
+            shards[self.shard_of(cluster.id)][cluster.id] = self.entry(centroid, member_count, cluster.get('last_updated'), model)
+            clusters[cluster.id] = (centroid, member_count, cluster.get('last_updated'), model)
+
+        batch = self.db.batch()
+        for shard, entries in shards.items():
+            self.check_size(self.shard_ref(shard).id, entries)
+            batch.set(self.shard_ref(shard), {'clusters': entries, 'updated': int(time.time()), 'shard_count': self.shards})
+        batch.commit()
+        logger.info(f"Cluster index built with {len(clusters)} clusters in {self.shards} shards.")
+        return clusters
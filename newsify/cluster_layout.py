@@ -0,0 +1,31 @@
+import time
+from typing import Any, Dict, List
+
+# Clusters created before the compact layout keep one articles_<timestamp> list per update instead of
+# article_refs, member_count, first_seen and last_seen; `python cluster.py migrate` converts them
+
+
+def get_legacy_article_keys(cluster_data: Dict[str, Any]) -> List[str]:
+    return [key for key, value in cluster_data.items() if key.startswith('articles_') and isinstance(value, list)]
+
+
+def get_cluster_article_refs(cluster_data: Dict[str, Any]) -> List[Any]:
+    refs = {ref.path: ref for ref in cluster_data.get('article_refs', [])}
+    for key in get_legacy_article_keys(cluster_data):
+        for ref in cluster_data[key]:
+            refs.setdefault(ref.path, ref)
+    return list(refs.values())
+
+
+def get_cluster_first_seen(cluster_data: Dict[str, Any]) -> int:
+    timestamps = [int(key[len('articles_'):]) for key in get_legacy_article_keys(cluster_data)]
+    if 'first_seen' in cluster_data:
+        timestamps.append(cluster_data['first_seen'])
+    return min(timestamps, default=cluster_data.get('last_updated', int(time.time())))
+
+
+def get_cluster_last_seen(cluster_data: Dict[str, Any]) -> int:
+    timestamps = [int(key[len('articles_'):]) for key in get_legacy_article_keys(cluster_data)]
+    if 'last_seen' in cluster_data:
+        timestamps.append(cluster_data['last_seen'])
+    return max(timestamps, default=cluster_data.get('last_updated', int(time.time())))
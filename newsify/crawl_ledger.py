@@ -0,0 +1,47 @@
+import os
+import sqlite3
+import time
+
+
+class CrawlLedger:
+    """Article URLs claimed by crawler processes, kept in SQLite.
+
+    Every process crawling from the same machine points at the same database
+    file; a URL is only followed by the process that claims it first. Claims
+    expire after `ttl` seconds, so articles a crashed worker never finished
+    (or that were dropped) are picked up again later. Articles already stored
+    are skipped through the Firestore URL ledger before they are ever claimed.
+    """
+
+    def __init__(self, path, ttl=60 * 60):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.ttl = ttl
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS claims (url TEXT PRIMARY KEY, worker TEXT NOT NULL, claimed_at REAL NOT NULL)')
+
+    @classmethod
+    def from_settings(cls, settings):
+        path = settings.get('CRAWL_LEDGER_PATH')
+        return cls(path, settings.getint('CRAWL_CLAIM_TTL')) if path else None
+
+    def claim(self, url, worker):
+        """Returns True if `worker` now holds the claim on `url`."""
+        now = time.time()
+        cursor = self.conn.execute(
+            'INSERT INTO claims (url, worker, claimed_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(url) DO UPDATE SET worker = excluded.worker, claimed_at = excluded.claimed_at '
+            'WHERE claims.claimed_at < ?',
+            (url, worker, now, now - self.ttl)
+        )
+        return cursor.rowcount == 1
+
+    def release(self, url, worker):
+        """Gives up `worker`'s claim on `url`, so the article can be retried before the claim expires."""
+        self.conn.execute('DELETE FROM claims WHERE url = ? AND worker = ?', (url, worker))
+
+    def prune(self):
+        self.conn.execute('DELETE FROM claims WHERE claimed_at < ?', (time.time() - self.ttl,))
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,188 @@
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+
+from .openai_gateway import PRIORITY_NORMAL
+
+logger = logging.getLogger(__name__)
+
+
+def get_article_text(article):
+    """Title followed by the summary, or the paragraphs when there is no summary."""
+    text = article['article_title'] + " "
+    text += article.get('article_summary') or ' '.join(
+        p['content'] for p in article['article_content'] if p['type'] == 'paragraph'
+    )
+    return text.strip()
+
+
+# What the crawler and the clusterer embedded with before EMBEDDING_MODEL and EMBEDDING_DIMENSIONS existed
+DEFAULT_OPENAI_MODEL = 'text-embedding-3-small'
+DEFAULT_OPENAI_DIMENSIONS = 512
+
+
+def legacy_model_tag(dimensions):
+    """The model of an embedding stored before embeddings recorded theirs.
+
+    Until then the crawler and the clusterer embedded with OpenAI's
+    text-embedding-3-small at 512 dimensions, or with the local backend,
+    whose embeddings are smaller, so the size tells them apart.
+    """
+    if dimensions == DEFAULT_OPENAI_DIMENSIONS:
+        return f'openai:{DEFAULT_OPENAI_MODEL}:{DEFAULT_OPENAI_DIMENSIONS}'
+    return f'local:{dimensions}'
+
+
+def get_stored_model_tag(data, embedding_field='article_embeddings', model_field='article_embedding_model'):
+    return data.get(model_field) or legacy_model_tag(len(data[embedding_field]))
+
+
+class OpenAIEmbeddingBackend:
+    name = 'openai'
+
+    def __init__(self, gateway, model=DEFAULT_OPENAI_MODEL, dimensions=DEFAULT_OPENAI_DIMENSIONS):
+        self.gateway = gateway
+        self.model = model
+        self.dimensions = dimensions
+        # Stored with every embedding, to tell which articles a model change has to re-embed
+        self.model_tag = f'openai:{model}:{dimensions}'
+
+    def embed(self, texts, priority=PRIORITY_NORMAL):
+        embeddings = self.gateway.embed(texts, model=self.model, dimensions=self.dimensions, priority=priority)
+        return np.array(embeddings, dtype=np.float32)
+
+
+class LocalEmbeddingBackend:
+    """CPU embeddings: hashed TF-IDF projected with a truncated SVD fitted on our own corpus.
+
+    The hashing vectorizer needs no vocabulary, so only the IDF weights and the
+    SVD projection are learned. Embedding a text is a sparse product and a
+    small dense projection, cheap enough to run on every scraped article.
+    """
+
+    name = 'local'
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.dimensions = pipeline.named_steps['svd'].n_components
+        self.model_tag = f'local:{self.dimensions}'
+
+    @classmethod
+    def fit(cls, texts, dimensions=256, n_features=2 ** 18):
+        from sklearn.decomposition import TruncatedSVD
+        from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+        from sklearn.pipeline import Pipeline
+        from sklearn.preprocessing import Normalizer
+
+        pipeline = Pipeline([
+            ('hashing', HashingVectorizer(n_features=n_features, ngram_range=(1, 2), alternate_sign=False, norm=None)),
+            ('tfidf', TfidfTransformer(sublinear_tf=True)),
+            ('svd', TruncatedSVD(n_components=dimensions, random_state=0)),
+            ('normalize', Normalizer(copy=False))
+        ])
+        pipeline.fit(texts)
+        return cls(pipeline)
+
+    @classmethod
+    def load(cls, path):
+        import joblib
+        return cls(joblib.load(path))
+
+    def save(self, path):
+        import joblib
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        joblib.dump(self.pipeline, path)
+
+    def embed(self, texts, priority=PRIORITY_NORMAL):
+        return self.pipeline.transform(texts).astype(np.float32)
+
+
+def get_embedding_backend(name, gateway=None, model_path=None, model=DEFAULT_OPENAI_MODEL, dimensions=DEFAULT_OPENAI_DIMENSIONS):
+    """The configured backend; `model` and `dimensions` only apply to OpenAI, a local model has its own."""
+    if name == 'openai':
+        return OpenAIEmbeddingBackend(gateway, model=model, dimensions=dimensions)
+    if name == 'local':
+        return LocalEmbeddingBackend.load(model_path)
+    raise ValueError(f"Unknown embedding backend: {name}")
+
+
+def load_corpus(limit):
+    """Streams up to `limit` articles from every source, newest first."""
+    from firebase_admin import firestore
+    from .firebase_manager import FirebaseManager
+
+    db = FirebaseManager().client
+    articles = []
+    for source in db.collection('news_sources').stream():
+        query = (source.reference.collection('articles')
+                 .order_by('article_published_date', direction=firestore.Query.DESCENDING)
+                 .limit(limit))
+        articles.extend(article.to_dict() for article in query.stream())
+    return articles
+
+
+def benchmark(backend, articles, neighbours=10, threshold=0.7, local_threshold=0.3):
+    """Measures how well the local embeddings agree with the stored OpenAI embeddings."""
+    from scipy.stats import spearmanr
+
+    # Only OpenAI embeddings are a reference, and only of the model most of them were stored with
+    tags = [get_stored_model_tag(article) for article in articles if 'article_embeddings' in article]
+    tags = [tag for tag in tags if tag.startswith('openai:')]
+    reference_tag = max(set(tags), key=tags.count, default=None)
+    articles = [article for article in articles if 'article_embeddings' in article and get_stored_model_tag(article) == reference_tag]
+    reference = np.array([list(article['article_embeddings']) for article in articles], dtype=np.float32)
+    reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+
+    start = time.perf_counter()
+    local = backend.embed([get_article_text(article) for article in articles])
+    elapsed = time.perf_counter() - start
+
+    reference_similarities = reference @ reference.T
+    local_similarities = local @ local.T
+    upper = np.triu_indices(len(articles), k=1)
+    correlation = spearmanr(reference_similarities[upper], local_similarities[upper]).correlation
+
+    np.fill_diagonal(reference_similarities, -np.inf)
+    np.fill_diagonal(local_similarities, -np.inf)
+    k = min(neighbours, len(articles) - 1)
+    reference_top = np.argsort(-reference_similarities, axis=1)[:, :k]
+    local_top = np.argsort(-local_similarities, axis=1)[:, :k]
+    overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(reference_top, local_top)])
+
+    # As a pre-filter the local backend must keep the pairs OpenAI would cluster together
+    related = reference_similarities[upper] >= threshold
+    kept = local_similarities[upper] >= local_threshold
+    recall = (related & kept).sum() / max(related.sum(), 1)
+
+    return {
+        'articles': len(articles),
+        'spearman': float(correlation),
+        f'neighbour_overlap@{k}': float(overlap),
+        'prefilter_recall': float(recall),
+        'prefilter_pass_rate': float(kept.mean()),
+        'ms_per_article': 1000 * elapsed / max(len(articles), 1)
+    }
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Fit or benchmark the local embedding backend.")
+    parser.add_argument('command', choices=['fit', 'benchmark'])
+    parser.add_argument('--model-path', default=os.getenv('LOCAL_EMBEDDING_MODEL_PATH', '.newsify/local_embeddings.joblib'))
+    parser.add_argument('--limit', type=int, default=5000, help="Articles to read per source.")
+    parser.add_argument('--dimensions', type=int, default=256)
+    parser.add_argument('--local-threshold', type=float, default=float(os.getenv('LOCAL_PREFILTER_THRESHOLD', '0.3')))
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.limit)
+    if args.command == 'fit':
+        logger.info(f"Fitting local embeddings on {len(corpus)} articles...")
+        LocalEmbeddingBackend.fit([get_article_text(article) for article in corpus], dimensions=args.dimensions).save(args.model_path)
+        logger.info(f"Local embedding model saved to {args.model_path}")
+    else:
+        results = benchmark(LocalEmbeddingBackend.load(args.model_path), corpus, local_threshold=args.local_threshold)
+        for metric, value in results.items():
+            logger.info(f"{metric}: {value:.4f}" if isinstance(value, float) else f"{metric}: {value}")
@@ -0,0 +1,127 @@
+# Define here your extensions
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/extensions.html
+
+import json
+import os
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+
+class AdaptiveRateController:
+    """Learns a download delay and concurrency for every domain.
+
+    Domains that answer quickly and cleanly are sped up step by step, while a
+    challenge response (403/429/503) or rising latency backs the domain off
+    sharply. The learned rates are persisted so the next run starts from them
+    instead of the global DOWNLOAD_DELAY.
+    """
+
+    BLOCK_STATUSES = (403, 429, 503)
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('RATE_CONTROLLER_ENABLED'):
+            raise NotConfigured
+
+        self.crawler = crawler
+        self.state_path = settings.get('RATE_CONTROLLER_STATE_PATH')
+        self.start_delay = settings.getfloat('DOWNLOAD_DELAY')
+        self.min_delay = settings.getfloat('RATE_CONTROLLER_MIN_DELAY')
+        self.max_delay = settings.getfloat('RATE_CONTROLLER_MAX_DELAY')
+        self.max_concurrency = settings.getint('RATE_CONTROLLER_MAX_CONCURRENCY')
+        self.target_latency = settings.getfloat('RATE_CONTROLLER_TARGET_LATENCY')
+        self.clean_streak = settings.getint('RATE_CONTROLLER_CLEAN_STREAK')
+        self.rates = self.load()
+        self.updated_domains = set()
+
+        crawler.signals.connect(self.request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(self.response_downloaded, signal=signals.response_downloaded)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def load(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def rate_for(self, domain):
+        return self.rates.setdefault(domain, {
+            'delay': self.start_delay,
+            'concurrency': 1,
+            'latency': None,
+            'clean': 0
+        })
+
+    def _slot(self, request):
+        key = request.meta.get('download_slot')
+        return key, self.crawler.engine.downloader.slots.get(key)
+
+    def request_reached_downloader(self, request, spider):
+        # Slots are recreated after being idle, so the learned rate is applied on every request
+        key, slot = self._slot(request)
+        if slot is None:
+            return
+        rate = self.rate_for(key)
+        slot.delay = rate['delay']
+        slot.concurrency = rate['concurrency']
+
+    def response_downloaded(self, response, request, spider):
+        key, slot = self._slot(request)
+        if key is None:
+            return
+
+        rate = self.rate_for(key)
+        latency = request.meta.get('download_latency')
+        previous_latency = rate['latency']
+
+        if response.status in self.BLOCK_STATUSES:
+            rate['delay'] = max(rate['delay'] * 2, self.start_delay)
+            rate['concurrency'] = 1
+            rate['clean'] = 0
+            self.crawler.stats.inc_value('rate_controller/blocked')
+            spider.logger.info(f"Backing off {key} after HTTP {response.status}: delay {rate['delay']:.2f}s")
+        elif latency is not None and (
+            latency > self.target_latency
+            or (previous_latency and latency > previous_latency * 1.5)
+        ):
+            rate['delay'] = max(rate['delay'] * 1.25, self.min_delay)
+            rate['concurrency'] = max(rate['concurrency'] - 1, 1)
+            rate['clean'] = 0
+            self.crawler.stats.inc_value('rate_controller/slowed')
+        elif response.status < 400:
+            rate['delay'] *= 0.9
+            rate['clean'] += 1
+            if rate['clean'] >= self.clean_streak:
+                rate['concurrency'] = min(rate['concurrency'] + 1, self.max_concurrency)
+                rate['clean'] = 0
+
+        rate['delay'] = min(max(rate['delay'], self.min_delay), self.max_delay)
+        if latency is not None:
+            rate['latency'] = latency if previous_latency is None else 0.7 * previous_latency + 0.3 * latency
+        self.updated_domains.add(key)
+
+        if slot is not None:
+            slot.delay = rate['delay']
+            slot.concurrency = rate['concurrency']
+
+    def spider_closed(self, spider):
+        # Other crawlers may share the state file, only overwrite the domains seen here
+        rates = self.load()
+        rates.update({domain: self.rates[domain] for domain in self.updated_domains})
+
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        tmp_path = f'{self.state_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(rates, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+        for domain in sorted(self.updated_domains):
+            rate = self.rates[domain]
+            spider.logger.info(f"Learned rate for {domain}: delay {rate['delay']:.2f}s, concurrency {rate['concurrency']}")
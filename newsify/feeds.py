@@ -0,0 +1,75 @@
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from lxml import etree
+
+# Namespaces differ between feeds (and are sometimes missing), so elements are matched by local name
+RSS_ITEMS = etree.XPath("/*[local-name()='rss']/*[local-name()='channel']/*[local-name()='item']")
+RSS_LINK = etree.XPath("string(*[local-name()='link'])")
+RSS_TITLE = etree.XPath("string(*[local-name()='title'])")
+RSS_DATE = etree.XPath("string(*[local-name()='pubDate'])")
+RSS_THUMBNAIL = etree.XPath(
+    "*[local-name()='thumbnail']/@url | *[local-name()='content'][starts-with(@medium, 'image') or starts-with(@type, 'image')]/@url"
+    " | *[local-name()='enclosure'][starts-with(@type, 'image')]/@url"
+)
+
+SITEMAP_URLS = etree.XPath("/*[local-name()='urlset']/*[local-name()='url']")
+SITEMAP_LINK = etree.XPath("string(*[local-name()='loc'])")
+SITEMAP_TITLE = etree.XPath("string(*[local-name()='news']/*[local-name()='title'])")
+SITEMAP_DATE = etree.XPath("string(*[local-name()='news']/*[local-name()='publication_date'] | *[local-name()='lastmod'])")
+SITEMAP_THUMBNAIL = etree.XPath("*[local-name()='image']/*[local-name()='loc']/text()")
+
+PARSER = etree.XMLParser(recover=True, resolve_entities=False, no_network=True, huge_tree=True)
+
+
+def parse_rfc822(value):
+    return int(parsedate_to_datetime(value).timestamp())
+
+
+def parse_iso(value):
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def read_entries(nodes, link, title, published, thumbnail, parse_date):
+    entries = []
+    for node in nodes:
+        url = link(node).strip()
+        if not url:
+            continue
+        try:
+            date = parse_date(published(node).strip())
+        except (TypeError, ValueError, IndexError):
+            date = None
+        thumbnails = thumbnail(node)
+        entries.append({
+            'url': url,
+            'title': title(node).strip() or None,
+            'thumbnail': str(thumbnails[0]).strip() if thumbnails else None,
+            'published': date
+        })
+    return entries
+
+
+def parse_feed(body):
+    """Reads the entries of an RSS 2.0 feed or a (news) sitemap.
+
+    Returns a list of {url, title, thumbnail, published} dicts, with the
+    publish date as a Unix timestamp or None when the feed does not give one,
+    or None when the document is neither a feed nor a sitemap.
+    """
+    try:
+        root = etree.fromstring(body, PARSER)
+    except etree.XMLSyntaxError:
+        return None
+    if root is None:
+        return None
+
+    tag = etree.QName(root).localname
+    if tag == 'rss':
+        return read_entries(RSS_ITEMS(root), RSS_LINK, RSS_TITLE, RSS_DATE, RSS_THUMBNAIL, parse_rfc822)
+    if tag == 'urlset':
+        return read_entries(SITEMAP_URLS(root), SITEMAP_LINK, SITEMAP_TITLE, SITEMAP_DATE, SITEMAP_THUMBNAIL, parse_iso)
+    return None
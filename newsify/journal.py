@@ -0,0 +1,83 @@
+import json
+import os
+import time
+
+
+class RunJournal:
+    """Append-only journal of a clustering run, used to resume it after a crash.
+
+    Every record is flushed and fsynced before the step it describes is
+    considered done. A journal holds three kinds of records:
+
+        value   an expensive result (the run plan, an OpenAI response) by key
+        done    a key of a write that has been applied to Firestore
+        complete  the run finished, the next run starts a fresh journal
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.values = {}
+        self.done = set()
+        self.resumed = False
+
+        if os.path.exists(path):
+            self._replay()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def _replay(self):
+        values = {}
+        done = set()
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn last line from an interrupted append
+                    continue
+                if record['kind'] == 'value':
+                    values[record['key']] = record['value']
+                elif record['kind'] == 'done':
+                    done.add(record['key'])
+                elif record['kind'] == 'complete':
+                    values, done = {}, set()
+
+        self.values = values
+        self.done = done
+        self.resumed = bool(values or done)
+
+    def _append(self, record):
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def put(self, key, value):
+        self.values[key] = value
+        self._append({'kind': 'value', 'key': key, 'value': value})
+        return value
+
+    def cached(self, key, compute):
+        if key in self.values:
+            return self.values[key]
+        return self.put(key, compute())
+
+    def is_done(self, key):
+        return key in self.done
+
+    def mark_done(self, key):
+        self.done.add(key)
+        self._append({'kind': 'done', 'key': key})
+
+    def close(self):
+        self.file.close()
+
+    def complete(self):
+        """Closes the run and keeps its journal next to the active one for inspection."""
+        self._append({'kind': 'complete', 'at': int(time.time())})
+        self.close()
+        os.replace(self.path, f'{self.path}.last')
+        self.values = {}
+        self.done = set()
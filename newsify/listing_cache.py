@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+
+
+class ListingCache:
+    """Remembers what a spider last saw on each of its listing pages.
+
+    For every listing URL it keeps the HTTP validators (ETag/Last-Modified)
+    used for conditional requests, and a fingerprint of the set of article
+    links extracted from the page, so an unchanged listing can be skipped
+    even when the server does not support conditional requests.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = self.load()
+        self.updated_urls = set()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)
+
+    @classmethod
+    def for_spider(cls, settings, spider_name):
+        return cls(os.path.join(settings.get('LISTING_CACHE_DIR'), f'{spider_name}.json'))
+
+    @staticmethod
+    def fingerprint(links):
+        joined = '\n'.join(sorted(set(link for link in links if link)))
+        return hashlib.sha1(joined.encode('utf-8')).hexdigest()
+
+    def conditional_headers(self, url):
+        entry = self.entries.get(url, {})
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def is_unchanged(self, url, links):
+        entry = self.entries.get(url)
+        return entry is not None and entry['fingerprint'] == self.fingerprint(links)
+
+    def update(self, url, links, etag=None, last_modified=None):
+        self.entries[url] = {
+            'fingerprint': self.fingerprint(links),
+            'etag': etag,
+            'last_modified': last_modified
+        }
+        self.updated_urls.add(url)
+
+    def save(self):
+        # Crawler processes sharing a spider's sections share its file, only overwrite the listings seen here
+        entries = self.load()
+        entries.update({url: self.entries[url] for url in self.updated_urls})
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
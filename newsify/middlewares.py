@@ -3,6 +3,7 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+from scrapy.exceptions import IgnoreRequest
 from scrapy.http import HtmlResponse
 
 import cloudscraper
@@ -19,4 +20,24 @@ class AntiBanMiddleware:
         spider.logger.info("Cloudflare detected. Using cloudscraper on URL: %s", request_url)
         cflare_response = self.cloudflare_scraper.get(request_url)
         cflare_res_transformed = HtmlResponse(url=request_url, body=cflare_response.text, encoding='utf-8')
-        return cflare_res_transformed
\ No newline at end of file
+        return cflare_res_transformed
+
+class ListingCacheMiddleware:
+    """Sends conditional requests for listing pages and drops 304 responses."""
+
+    def process_request(self, request, spider):
+        listing_cache = getattr(spider, 'listing_cache', None)
+        if not request.meta.get('listing') or listing_cache is None:
+            return None
+
+        for header, value in listing_cache.conditional_headers(request.url).items():
+            request.headers.setdefault(header, value)
+        return None
+
+    def process_response(self, request, response, spider):
+        if response.status != 304 or not request.meta.get('listing'):
+            return response
+
+        spider.logger.info("Listing not modified since last crawl: %s", request.url)
+        spider.crawler.stats.inc_value('newsify/listing_not_modified')
+        raise IgnoreRequest(f"Listing not modified: {request.url}")
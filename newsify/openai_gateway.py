@@ -0,0 +1,219 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HIGH = 0  # Cluster creation and updates
+PRIORITY_NORMAL = 1  # Articles coming in from the crawl
+PRIORITY_LOW = 2  # Backfills
+
+# Requests and tokens per minute for every model we call
+DEFAULT_RATE_LIMITS = {
+    "text-embedding-3-small": {"rpm": 3000, "tpm": 1000000},
+    "gpt-4o-mini": {"rpm": 500, "tpm": 200000},
+}
+
+
+class TokenBuckets:
+    """Per-minute token buckets kept in SQLite.
+
+    The crawler and the clusterer run as separate processes; pointing them at
+    the same database file makes them draw from a single OpenAI budget.
+    Without a path the buckets only live in memory.
+    """
+
+    def __init__(self, path=None):
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path or ':memory:', timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+
+    def _level(self, name, capacity, now):
+        row = self.conn.execute('SELECT tokens, updated FROM buckets WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            return capacity
+        tokens, updated = row
+        return min(capacity, tokens + (now - updated) * capacity / 60)
+
+    def _store(self, name, tokens, now):
+        self.conn.execute(
+            'INSERT INTO buckets (name, tokens, updated) VALUES (?, ?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+            (name, tokens, now)
+        )
+
+    def acquire(self, amounts, reserve=0.0):
+        """Takes every amount from its bucket at once, or none of them.
+
+        `amounts` maps a bucket name to (capacity per minute, amount). A bucket
+        must keep `reserve` of its capacity after the withdrawal, which holds
+        back room for higher priorities. Returns 0 when the amounts were taken,
+        otherwise the seconds to wait before trying again.
+        """
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                now = time.time()
+                levels = {}
+                wait = 0.0
+                for name, (capacity, amount) in amounts.items():
+                    levels[name] = self._level(name, capacity, now)
+                    needed = min(min(amount, capacity) + reserve * capacity, capacity)
+                    if levels[name] < needed:
+                        wait = max(wait, (needed - levels[name]) * 60 / capacity)
+
+                for name, (capacity, amount) in amounts.items():
+                    self._store(name, levels[name] - (min(amount, capacity) if wait == 0 else 0), now)
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+        return wait
+
+    def refund(self, name, capacity, amount):
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            self._store(name, min(capacity, self._level(name, capacity, now) + amount), now)
+            self.conn.execute('COMMIT')
+
+
+class OpenAIGateway:
+    """The single way this project calls OpenAI.
+
+    Every request is admitted through per-model request and token buckets,
+    with lower priorities keeping a reserve free for higher ones. Rate limits,
+    timeouts and server errors are retried with jittered exponential backoff
+    that honours the rate-limit headers. Identical requests in flight at the
+    same time are sent only once.
+    """
+
+    RESERVES = {PRIORITY_HIGH: 0.0, PRIORITY_NORMAL: 0.1, PRIORITY_LOW: 0.3}
+
+    def __init__(self, api_key, state_path=None, rate_limits=None, max_retries=6, max_backoff=60.0):
+        # Imported here so that importing the priorities stays cheap for command-line tools
+        import openai
+        import tiktoken
+
+        # Retries are handled here, where they can be coordinated with the buckets
+        self.client = openai.OpenAI(api_key=api_key, max_retries=0)
+        self.retryable_errors = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+        self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.buckets = TokenBuckets(state_path)
+        self.rate_limits = {**DEFAULT_RATE_LIMITS, **(rate_limits or {})}
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.lock = threading.Lock()
+        self.in_flight = {}
+
+    def count_tokens(self, text):
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def embed(self, texts, model="text-embedding-3-small", dimensions=512, priority=PRIORITY_NORMAL):
+        tokens = sum(self.count_tokens(text) for text in texts)
+        response = self._request(
+            model, tokens, priority, ('embeddings', model, dimensions, texts),
+            lambda: self.client.embeddings.create(model=model, input=texts, encoding_format="float", dimensions=dimensions)
+        )
+        return [data.embedding for data in response.data]
+
+    def chat(self, messages, model="gpt-4o-mini", priority=PRIORITY_NORMAL, **kwargs):
+        # The completion length is unknown up front, the estimate is corrected from the usage afterwards
+        tokens = sum(self.count_tokens(message['content']) for message in messages) + kwargs.get('max_tokens', 1000)
+        return self._request(
+            model, tokens, priority, ('chat', model, messages, kwargs),
+            lambda: self.client.chat.completions.create(model=model, messages=messages, **kwargs)
+        )
+
+    def _request(self, model, tokens, priority, request, call):
+        key = hashlib.sha1(json.dumps(request, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        with self.lock:
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self.in_flight[key] = Future()
+        if not owner:
+            logger.debug("Coalescing identical OpenAI request for %s", model)
+            return future.result()
+
+        try:
+            response = self._call_with_retries(model, tokens, priority, call)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+    def _admit(self, model, tokens, priority):
+        limits = self.rate_limits.get(model)
+        if not limits:
+            return
+        amounts = {f'{model}:requests': (limits['rpm'], 1), f'{model}:tokens': (limits['tpm'], tokens)}
+        while True:
+            wait = self.buckets.acquire(amounts, self.RESERVES[priority])
+            if wait == 0:
+                return
+            time.sleep(wait + random.uniform(0, 0.1 * wait))
+
+    def _reconcile(self, model, tokens, response):
+        limits = self.rate_limits.get(model)
+        usage = getattr(response, 'usage', None)
+        if limits and usage is not None and usage.total_tokens < tokens:
+            self.buckets.refund(f'{model}:tokens', limits['tpm'], tokens - usage.total_tokens)
+
+    def _call_with_retries(self, model, tokens, priority, call):
+        for attempt in range(self.max_retries + 1):
+            self._admit(model, tokens, priority)
+            try:
+                response = call()
+            except self.retryable_errors as e:
+                if attempt == self.max_retries or getattr(e, 'code', None) == 'insufficient_quota':
+                    raise
+                delay = self._backoff(attempt, getattr(e, 'response', None))
+                logger.warning(f"OpenAI {model} request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            self._reconcile(model, tokens, response)
+            return response
+
+    def _backoff(self, attempt, response):
+        # Full jitter, but never earlier than the server asked for
+        delay = random.uniform(0, min(self.max_backoff, 2 ** attempt))
+        if response is not None:
+            delay = max(delay, min(self.max_backoff, parse_retry_headers(response.headers)) + random.uniform(0, 0.5))
+        return delay
+
+
+DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+def parse_duration(value):
+    """Parses OpenAI reset durations such as '20ms', '1s' or '6m0s' into seconds."""
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in DURATION_PART.findall(value))
+
+
+def parse_retry_headers(headers):
+    if headers.get('retry-after-ms'):
+        return float(headers['retry-after-ms']) / 1000
+    if headers.get('retry-after'):
+        try:
+            return float(headers['retry-after'])
+        except ValueError:
+            pass
+    return max(
+        (parse_duration(headers[name]) for name in ('x-ratelimit-reset-requests', 'x-ratelimit-reset-tokens') if headers.get(name)),
+        default=0.0
+    )
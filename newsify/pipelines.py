@@ -1,29 +1,53 @@
-from openai import OpenAI
+import logging
 import tiktoken
 from scrapy.exceptions import DropItem
 
-from newsify import spiders
 from firebase_admin import firestore
 from .firebase_manager import FirebaseManager
 import time
 from google.cloud.firestore_v1.vector import Vector
+from .embeddings import DEFAULT_OPENAI_DIMENSIONS, DEFAULT_OPENAI_MODEL, get_embedding_backend
+from .openai_gateway import OpenAIGateway
+
+logger = logging.getLogger(__name__)
     
 class OpenAIProcessingPipeline:
-    def __init__(self, api_key):
+    def __init__(self, api_key, embedding_backend='openai', local_model_path=None, defer_embeddings=False,
+                 gateway_state_path=None, rate_limits=None, embedding_model=DEFAULT_OPENAI_MODEL, embedding_dimensions=DEFAULT_OPENAI_DIMENSIONS):
         self.api_key = api_key
-        self.openai_client = OpenAI(api_key=self.api_key)
+        # Without a key, articles are stored without summaries (and, through the local backend, still embedded)
+        self.gateway = OpenAIGateway(api_key=self.api_key, state_path=gateway_state_path, rate_limits=rate_limits) if api_key else None
         self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.defer_embeddings = defer_embeddings
+        if self.gateway is None and embedding_backend == 'openai' and not self.defer_embeddings:
+            raise ValueError("OPENAI_API_KEY is required to embed articles with the openai backend, set EMBEDDING_BACKEND=local or DEFER_ARTICLE_EMBEDDINGS")
+        # The same backend, model and dimensions as the clusterer's, see EMBEDDING_MODEL
+        self.embedder = None if defer_embeddings else get_embedding_backend(
+            embedding_backend, gateway=self.gateway, model_path=local_model_path,
+            model=embedding_model, dimensions=embedding_dimensions
+        )
+        if self.gateway is None:
+            logger.warning("No OPENAI_API_KEY, articles are stored without summaries.")
 
     @classmethod
     def from_crawler(cls, crawler):
         return cls(
-            api_key=crawler.settings.get('OPENAI_API_KEY')
+            api_key=crawler.settings.get('OPENAI_API_KEY'),
+            embedding_backend=crawler.settings.get('EMBEDDING_BACKEND'),
+            local_model_path=crawler.settings.get('LOCAL_EMBEDDING_MODEL_PATH'),
+            defer_embeddings=crawler.settings.getbool('DEFER_ARTICLE_EMBEDDINGS'),
+            gateway_state_path=crawler.settings.get('OPENAI_GATEWAY_STATE_PATH'),
+            rate_limits=crawler.settings.getdict('OPENAI_RATE_LIMITS'),
+            embedding_model=crawler.settings.get('EMBEDDING_MODEL'),
+            embedding_dimensions=crawler.settings.getint('EMBEDDING_DIMENSIONS')
         )
 
     def process_item(self, item, spider):
-        # Generate embeddings
-        embeddings = self.get_embeddings(item)
-        item['article_embeddings'] = embeddings
+        # Generate embeddings, unless the clusterer embeds the article only once it looks related to something
+        if not self.defer_embeddings:
+            embeddings = self.get_embeddings(item)
+            item['article_embeddings'] = embeddings
+            item['article_embedding_model'] = self.embedder.model_tag
 
         # Generate summary if the content is long enough
         summary = self.get_summary(item)
@@ -46,15 +70,9 @@ class OpenAIProcessingPipeline:
             encoded_text = encoded_text[:8000]
             text_to_embed = self.encoding.decode(encoded_text)
         
-        # Get embeddings from OpenAI
-        response = self.openai_client.embeddings.create(
-            model="text-embedding-3-small",
-            input=text_to_embed,
-            encoding_format="float",
-            dimensions=512  
-        )
+        [embedding] = self.embedder.embed([text_to_embed])
         
-        return response.data[0].embedding
+        return embedding.tolist()
 
     def get_summary(self, item):
         # Concatenate only paragraphs
@@ -66,12 +84,12 @@ class OpenAIProcessingPipeline:
         encoded_text = self.encoding.encode(text_to_summarize)
         
         # Check if the text is more than 300 tokens
-        if len(encoded_text) <= 300:
+        if len(encoded_text) <= 300 or self.gateway is None:
             return None
         
         # Generate summary using OpenAI API
         try:
-            completion = self.openai_client.chat.completions.create(
+            completion = self.gateway.chat(
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": "Ju jeni një asistent i dobishëm që përmbledh artikujt e lajmeve."},
@@ -80,7 +98,7 @@ class OpenAIProcessingPipeline:
             )
             return completion.choices[0].message.content
         except Exception as e:
-            spiders.logger.error(f"Error generating summary: {str(e)}")
+            logger.error(f"Error generating summary: {str(e)}")
             return None
 
 class ArticleValidationPipeline:
@@ -112,10 +130,13 @@ class FirestorePipeline:
             'article_content': item['article_content'],
             'article_published_date': item['article_published_date'],
             'article_category': item['article_category'],
-            'article_embeddings': Vector(item['article_embeddings']),
             'cluster_id':-1
         }
 
+        if 'article_embeddings' in item:
+            article_data['article_embeddings'] = Vector(item['article_embeddings'])
+            article_data['article_embedding_model'] = item.get('article_embedding_model')
+
         if 'article_summary' in item:
             article_data['article_summary'] = item['article_summary']
 
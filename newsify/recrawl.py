@@ -0,0 +1,68 @@
+import time
+
+
+class RecrawlPolicy:
+    """Adaptive recrawl interval for a single news source.
+
+    The interval follows the observed publish rate of the source (new listing
+    links per second) so that every poll is expected to find roughly
+    `target_new_articles` new articles. The novelty rate (share of listing
+    links that were not scraped yet) corrects the estimate: a listing made up
+    mostly of new links has probably rolled over articles we never saw.
+    """
+
+    def __init__(self, initial_interval=600, min_interval=120, max_interval=3600,
+                 target_new_articles=3, smoothing=0.3, high_novelty=0.5):
+        self.interval = initial_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_new_articles = target_new_articles
+        self.smoothing = smoothing
+        self.high_novelty = high_novelty
+        self.publish_rate = None
+        self.novelty_rate = None
+        self.last_crawl = None
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            initial_interval=settings.getfloat('RECRAWL_INITIAL_INTERVAL'),
+            min_interval=settings.getfloat('RECRAWL_MIN_INTERVAL'),
+            max_interval=settings.getfloat('RECRAWL_MAX_INTERVAL'),
+            target_new_articles=settings.getfloat('RECRAWL_TARGET_NEW_ARTICLES'),
+        )
+
+    def _smooth(self, previous, value):
+        if previous is None:
+            return value
+        return self.smoothing * value + (1 - self.smoothing) * previous
+
+    def observe(self, links_seen, links_new, finished_at=None):
+        """Record the outcome of a crawl and return the next interval in seconds."""
+        finished_at = finished_at or time.time()
+
+        novelty = links_new / links_seen if links_seen else 0.0
+        self.novelty_rate = self._smooth(self.novelty_rate, novelty)
+
+        # The first crawl has no previous crawl to measure the elapsed time against
+        if self.last_crawl is not None:
+            elapsed = max(finished_at - self.last_crawl, 1.0)
+            self.publish_rate = self._smooth(self.publish_rate, links_new / elapsed)
+        self.last_crawl = finished_at
+
+        self.interval = self.next_interval()
+        return self.interval
+
+    def next_interval(self):
+        if self.publish_rate is None:
+            interval = self.interval
+        elif self.publish_rate > 0:
+            interval = self.target_new_articles / self.publish_rate
+        else:
+            # Nothing new lately, back off gradually instead of jumping to the maximum
+            interval = self.interval * 2
+
+        if self.novelty_rate is not None and self.novelty_rate >= self.high_novelty:
+            interval = min(interval, self.interval) * (1 - self.novelty_rate / 2)
+
+        return min(max(interval, self.min_interval), self.max_interval)
@@ -28,6 +28,8 @@ NEWSPIDER_MODULE = "newsify.spiders"
 # Configure a delay for requests for the same website (default: 0)
 # See https://docs.scrapy.org/en/latest/topics/settings.html#download-delay
 # See also autothrottle settings and docs
+# With the rate controller enabled this is only the starting delay for domains
+# it has not learned a rate for yet
 DOWNLOAD_DELAY = 3
 # The download delay setting will honor only one of:
 #CONCURRENT_REQUESTS_PER_DOMAIN = 16
@@ -54,14 +56,27 @@ DOWNLOAD_DELAY = 3
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 DOWNLOADER_MIDDLEWARES = {
+    "newsify.middlewares.ListingCacheMiddleware": 542,
     "newsify.middlewares.AntiBanMiddleware": 543,
 }
 LOG_LEVEL = 'INFO'
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
-#    "scrapy.extensions.telnet.TelnetConsole": None,
-#}
+EXTENSIONS = {
+    "newsify.extensions.AdaptiveRateController": 500,
+}
+
+# Per-domain rate controller: speeds up fast, clean domains and backs off on
+# challenge responses or rising latency. Learned rates are kept between runs.
+RATE_CONTROLLER_ENABLED = True
+RATE_CONTROLLER_STATE_PATH = '.newsify/rate_controller.json'
+RATE_CONTROLLER_MIN_DELAY = 0.25
+RATE_CONTROLLER_MAX_DELAY = 60
+RATE_CONTROLLER_MAX_CONCURRENCY = 8
+# Responses slower than this (seconds) count as a latency signal
+RATE_CONTROLLER_TARGET_LATENCY = 2.0
+# Consecutive clean responses needed before concurrency is raised
+RATE_CONTROLLER_CLEAN_STREAK = 10
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
@@ -73,6 +88,49 @@ ITEM_PIPELINES = {
 
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 FIREBASE_CRED_PATH = os.getenv('FIREBASE_CRED_PATH')
+# 'openai', or 'local' for the CPU backend fitted with `python -m newsify.embeddings fit`.
+# Use the same backend for the clusterer.
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'openai')
+# The OpenAI embedding model and its dimensions, shared with the clusterer (and backfill-embeddings)
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small')
+EMBEDDING_DIMENSIONS = int(os.getenv('EMBEDDING_DIMENSIONS', '512'))
+LOCAL_EMBEDDING_MODEL_PATH = os.getenv('LOCAL_EMBEDDING_MODEL_PATH', '.newsify/local_embeddings.joblib')
+# Leave embedding to the clusterer, which only calls OpenAI for articles its local
+# pre-filter finds related to an active cluster or another new article
+DEFER_ARTICLE_EMBEDDINGS = False
+
+# All OpenAI calls go through OpenAIGateway. The crawler and the clusterer share their
+# rate-limit buckets through this file. OPENAI_RATE_LIMITS overrides the per-model
+# limits as JSON, e.g. {"gpt-4o-mini": {"rpm": 500, "tpm": 200000}}
+OPENAI_GATEWAY_STATE_PATH = os.getenv('OPENAI_GATEWAY_STATE_PATH', '.newsify/openai_gateway.sqlite')
+OPENAI_RATE_LIMITS = os.getenv('OPENAI_RATE_LIMITS', '{}')
+
+# Crawl daemon (run_spiders.py --daemon): every source is re-polled on its own
+# interval, adapted to its observed publish rate and share of new listing links
+RECRAWL_INITIAL_INTERVAL = 600
+RECRAWL_MIN_INTERVAL = 120
+RECRAWL_MAX_INTERVAL = 3600
+# New articles a single poll should find on average
+RECRAWL_TARGET_NEW_ARTICLES = 3
+# Per-listing cap on followed articles while running as a daemon
+RECRAWL_MAX_ARTICLES = 30
+
+# Validators and article-link fingerprints of listing pages, one file per spider
+LISTING_CACHE_DIR = '.newsify/listing_cache'
+
+# Article URLs claimed by crawler processes (run_spiders.py --workers), so no two
+# processes follow the same article. Claims expire after CRAWL_CLAIM_TTL seconds
+CRAWL_LEDGER_PATH = os.getenv('CRAWL_LEDGER_PATH', '.newsify/crawl_ledger.sqlite')
+CRAWL_CLAIM_TTL = 60 * 60
+# Seconds the sharded launcher gives workers to finish after a shutdown request
+CRAWL_SHUTDOWN_TIMEOUT = 60
+
+# 'feed' discovers articles through each site's RSS feed or news sitemap where its spec
+# has one, falling back to the HTML listing; 'html' always scrapes the listings
+DISCOVERY_MODE = os.getenv('DISCOVERY_MODE', 'feed')
+# Articles published longer ago than this are never fetched or processed, it matches
+# the window get_new_articles in cluster.py considers
+FRESHNESS_WINDOW = 24 * 60 * 60
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
 #AUTOTHROTTLE_ENABLED = True
@@ -0,0 +1,133 @@
+# Declarative descriptions of the news sites we scrape
+#
+# Every spec is compiled once by newsify.spiders.spec_spider into lxml XPath
+# objects. Selectors are CSS (with parsel's ::text and ::attr() extensions)
+# unless prefixed with "xpath:", and are evaluated relative to the node they
+# apply to: the page, a listing item or a content element.
+#
+#   name              spider name, also the news_sources document id
+#   start_urls        listing pages
+#   category_segment  index of the URL path segment naming the category
+#   feeds             optional, start URL -> RSS feed or news sitemap listing the
+#                     same articles with their publish dates (DISCOVERY_MODE = 'feed')
+#   listing           items: one node per article on a listing page;
+#                     url, title, thumbnail: values read from each item
+#   content           elements: the nodes making up the article body;
+#                     rules: tried in order on every element, the first one whose
+#                     tag/class match and whose content is not empty wins
+#   image             the article's main image
+#   published_date    where and how to read the publish time
+#
+# A value rule is either a selector string, a list of alternatives (the first
+# non-empty one wins) or a dict with:
+#   select   the selector
+#   join     join all matches with this string instead of taking the first
+#   strip    strip this set of characters (True: whitespace) from every match
+#   re       keep the first group of this regex
+#   prefix   prepended to values that do not start with http
+
+ALBANIAN_MONTHS = {
+    'Janar': 1, 'Shkurt': 2, 'Mars': 3, 'Prill': 4, 'Maj': 5, 'Qershor': 6,
+    'Korrik': 7, 'Gusht': 8, 'Shtator': 9, 'Tetor': 10, 'Nëntor': 11, 'Dhjetor': 12
+}
+
+LAPSI = {
+    'name': 'lapsi',
+    'start_urls': ['https://lapsi.al/kategoria/te-fundit/'],
+    'category_segment': -2,
+    'feeds': {'https://lapsi.al/kategoria/te-fundit/': 'https://lapsi.al/kategoria/te-fundit/feed/'},
+    'listing': {
+        'items': 'div#content article',
+        'url': 'div.post-content-wrapper a::attr(href)',
+        'title': 'div.post-content-wrapper a ::text',
+        'thumbnail': 'img::attr(src)',
+    },
+    'content': {
+        'elements': 'div.entry-content > *',
+        'rules': [
+            {'tag': 'p', 'type': 'iframe', 'content': 'iframe::attr(src)'},
+            {'tag': 'p', 'type': 'paragraph', 'content': {'select': '*::text', 'join': ''}},
+            {'tag': 'image', 'type': 'image', 'content': 'img::attr(src)', 'fields': {'content_caption': 'figcaption::text'}},
+            {'tag': 'div', 'class': 'wp-video', 'type': 'video', 'content': 'video source::attr(src)'},
+        ],
+    },
+    'image': 'div.post-preview img::attr(src)',
+    'published_date': {
+        'select': 'div.entry-meta time.published::attr(datetime)',
+        'format': 'iso',
+    },
+}
+
+PAMFLETI = {
+    'name': 'pamfleti',
+    'start_urls': ['https://pamfleti.net/category/aktualitet/'],
+    'category_segment': -2,
+    'feeds': {'https://pamfleti.net/category/aktualitet/': 'https://pamfleti.net/category/aktualitet/feed/'},
+    'listing': {
+        'items': 'div.c-flexy.shtoketu article.a-card',
+        'url': {'select': 'a::attr(href)', 'prefix': 'https://pamfleti.net'},
+        'title': 'h3.a-head::text',
+        'thumbnail': 'img.a-media_img::attr(data-src)',
+    },
+    'content': {
+        'elements': 'div.all-content p, div.all-content div.kodiim',
+        'rules': [
+            {'tag': 'p', 'type': 'paragraph', 'content': '::text'},
+            {'tag': 'p', 'type': 'iframe', 'content': 'iframe::attr(src)'},
+            {'tag': 'p', 'type': 'image', 'content': 'img::attr(src)'},
+            {'tag': 'div', 'class': 'kodiim', 'type': 'iframe', 'content': 'iframe::attr(src)'},
+        ],
+    },
+    'image': [
+        'div.all-content div.horizontal.imazhiim img::attr(src)',
+        'div.all-content p img::attr(src)',
+    ],
+    'published_date': {
+        'select': 'span.a-date::text',
+        'format': '%d %m %Y %H:%M',
+        'months': ALBANIAN_MONTHS,
+        'timezone': 'Europe/Tirane',
+    },
+}
+
+SYRI = {
+    'name': 'syri',
+    'start_urls': ['https://www.syri.net/politike'],
+    'category_segment': -1,
+    'listing': {
+        'items': 'div.categ-left, div.col-sm-6.col-xs-12.new-style, div.col-md-3.col-sm-6.col-xs-12.news-box.blue, div.col-md-4.col-sm-4.col-xs-12.news-box.blue',
+        'url': 'a::attr(href)',
+        'title': 'a h1::text, a h2::text',
+        'thumbnail': [
+            {'select': 'div.categ-lg::attr(style)', 're': r'url\((.*?)\)', 'strip': "'", 'prefix': 'https://syri.net'},
+            {
+                'select': 'div.img-cover::attr(data-original), div.categ-sm.img-cover::attr(data-original), div.img-holder.img-cover::attr(data-original)',
+                'strip': "'",
+                'prefix': 'https://syri.net',
+            },
+        ],
+    },
+    'content': {
+        'elements': 'div.readmore-text-here p',
+        'rules': [
+            {'type': 'paragraph', 'content': {'select': 'xpath:.//text()', 'join': ' ', 'strip': True}},
+            {'type': 'image', 'content': 'img::attr(src)'},
+            {'type': 'iframe', 'content': 'iframe::attr(src)'},
+        ],
+    },
+    'image': {
+        'select': 'div.prime-left.readmore iframe::attr(src), div.prime-left.readmore img::attr(src)',
+        'prefix': 'https://syri.net',
+    },
+    'published_date': {
+        'select': 'span.date strong::text',
+        # The first match is the time, the second the date
+        'parts': [1, 0],
+        'format': '%d/%m/%Y %H:%M',
+        'timezone': 'Europe/Tirane',
+    },
+}
+
+# Outlets served entirely by the spec engine. Syri also needs a Selenium step
+# for its photo galleries, see SyriSpider.
+SITES = [LAPSI, PAMFLETI]
@@ -1,6 +1,12 @@
 import scrapy
+from scrapy import signals
+from scrapy.spidermiddlewares.httperror import HttpError
 from abc import ABC, abstractmethod
+import os
 import time
+from scrapy.utils.project import get_project_settings
+from ..crawl_ledger import CrawlLedger
+from ..listing_cache import ListingCache
 
 class BaseNewsSpider(scrapy.Spider, ABC):
     name = 'base_news'
@@ -9,6 +15,34 @@ class BaseNewsSpider(scrapy.Spider, ABC):
     
     def __init__(self, *args, **kwargs):
         super(BaseNewsSpider, self).__init__(*args, **kwargs)
+        self.max_articles = int(self.max_articles)
+        settings = get_project_settings()
+        self.listing_cache = ListingCache.for_spider(settings, self.name)
+        self.freshness_window = settings.getint('FRESHNESS_WINDOW')
+        self.crawl_ledger = CrawlLedger.from_settings(settings)
+        self.worker = f'{self.name}:{os.getpid()}'
+        self.pending_listings = {}
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(BaseNewsSpider, cls).from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.item_stored, signal=signals.item_scraped)
+        crawler.signals.connect(spider.item_dropped, signal=signals.item_dropped)
+        crawler.signals.connect(spider.item_failed, signal=signals.item_error)
+        return spider
+
+    def start_requests(self):
+        for url in self.start_urls:
+            yield scrapy.Request(url, self.parse, dont_filter=True, meta={'listing': True})
+
+    def closed(self, reason):
+        if self.pending_listings:
+            self.logger.info(f"Not remembering {len(self.pending_listings)} listings, some of their articles were not stored.")
+        self.listing_cache.save()
+        if self.crawl_ledger is not None:
+            # Also when only the daemon runs, the launcher of sharded crawls is not the only one to prune
+            self.crawl_ledger.prune()
+            self.crawl_ledger.close()
 
     @abstractmethod
     def parse(self, response):
@@ -68,4 +102,94 @@ class BaseNewsSpider(scrapy.Spider, ABC):
         if ledger_doc.exists:
             ledger = ledger_doc.to_dict()
         
-        return ledger
\ No newline at end of file
+        return ledger
+
+    def is_scraped(self, category, url):
+        # Listing stats feed the recrawl policy of the crawl daemon
+        self.crawler.stats.inc_value('newsify/listing_links')
+        return url in self.url_ledger.get(category, set())
+
+    def claim(self, url):
+        """Claims an article not scraped yet. False if another crawler process (or an earlier poll still in flight) is on it."""
+        if self.crawl_ledger is not None and not self.crawl_ledger.claim(url, self.worker):
+            self.crawler.stats.inc_value('newsify/claimed_elsewhere')
+            return False
+        self.crawler.stats.inc_value('newsify/listing_new_links')
+        return True
+
+    def release(self, url):
+        if self.crawl_ledger is not None and url:
+            self.crawl_ledger.release(url, self.worker)
+
+    def is_stale(self, published_date):
+        # Articles the clusterer will never look at are not worth fetching or processing
+        if published_date is None or published_date >= time.time() - self.freshness_window:
+            return False
+        self.crawler.stats.inc_value('newsify/stale_articles')
+        return True
+
+    def listing_unchanged(self, response, links):
+        if not self.listing_cache.is_unchanged(response.url, links):
+            return False
+        self.logger.info(f"Listing unchanged since last crawl, skipping: {response.url}")
+        self.crawler.stats.inc_value('newsify/listing_unchanged')
+        self.crawler.stats.inc_value('newsify/listing_links', len(links))
+        return True
+
+    def remember_listing(self, response, links, followed=()):
+        """Remembers the listing once every article followed from it is stored.
+
+        Until then an unchanged listing must not be skipped, or articles whose
+        request failed or whose item was dropped would never be retried.
+        """
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        self.pending_listings[response.url] = {
+            'links': links,
+            'etag': etag.decode('latin-1') if etag else None,
+            'last_modified': last_modified.decode('latin-1') if last_modified else None,
+            'pending': set(followed)
+        }
+        self.settle_listing(response.url)
+
+    def settle_listing(self, url):
+        listing = self.pending_listings[url]
+        if not listing['pending']:
+            del self.pending_listings[url]
+            self.listing_cache.update(url, listing['links'], listing['etag'], listing['last_modified'])
+
+    def article_done(self, url):
+        # Stored, or dropped for good (stale articles stay stale)
+        for listing_url in list(self.pending_listings):
+            if url in self.pending_listings[listing_url]['pending']:
+                self.pending_listings[listing_url]['pending'].discard(url)
+                self.settle_listing(listing_url)
+
+    def item_stored(self, item, response, spider):
+        # item_scraped only fires for items that passed every pipeline
+        self.article_done(item.get('article_url'))
+
+    def item_dropped(self, item, response, exception, spider):
+        # Dropped by validation (e.g. no content), fetching it again would not change that
+        self.release(item.get('article_url'))
+        self.article_done(item.get('article_url'))
+
+    def item_failed(self, item, response, spider, failure):
+        # A pipeline failed (e.g. the Firestore write), the listing stays pending and the next poll retries it
+        self.release(item.get('article_url'))
+
+    def article_failed(self, failure):
+        """Errback of article requests.
+
+        A client error (404, 410, ...) will not go away, so the article counts
+        as done. Anything else (timeouts, 5xx, 429) keeps its listing pending,
+        so the next poll fetches the listing in full and retries the article.
+        """
+        url = failure.request.meta['article_url']
+        if failure.check(HttpError) and 400 <= failure.value.response.status < 500 and failure.value.response.status not in (408, 429):
+            self.logger.info(f"Article gone ({failure.value.response.status}), not retrying: {url}")
+            self.article_done(url)
+        else:
+            self.logger.warning(f"Article request failed ({failure.value!r}), retrying on the next poll: {url}")
+            self.crawler.stats.inc_value('newsify/article_failures')
+            self.release(url)
@@ -0,0 +1,11 @@
+# Spiders generated from the specs in newsify.sites, one class per outlet
+# (LapsiSpider, PamfletiSpider, ...). To add an outlet, add its spec to SITES.
+
+from .spec_spider import spider_from_spec
+from ..sites import SITES
+
+for spec in SITES:
+    spider = spider_from_spec(spec, module=__name__)
+    globals()[spider.__name__] = spider
+
+del spec, spider
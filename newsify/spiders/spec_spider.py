@@ -0,0 +1,339 @@
+import argparse
+import re
+import time
+from datetime import datetime
+
+import pytz
+from lxml import etree
+from parsel import Selector
+from parsel.csstranslator import HTMLTranslator
+from scrapy import Request
+from scrapy.exceptions import IgnoreRequest
+from scrapy.spidermiddlewares.httperror import HttpError
+from scrapy.utils.project import get_project_settings
+
+from .base_spider import BaseNewsSpider
+from ..feeds import parse_feed
+from ..firebase_manager import FirebaseManager
+
+translator = HTMLTranslator()
+
+
+def to_xpath(query):
+    if query.startswith('xpath:'):
+        return query[len('xpath:'):]
+    return translator.css_to_xpath(query)
+
+
+def compile_query(query, precompiled=True):
+    xpath = to_xpath(query)
+    if precompiled:
+        return etree.XPath(xpath)
+    # Re-parses the expression on every call, like the response.css calls in hand-written spiders
+    return lambda node: node.xpath(xpath)
+
+
+class ValueRule:
+    """A compiled value rule from a site spec, see newsify.sites for the format."""
+
+    def __init__(self, rule, precompiled=True):
+        if isinstance(rule, str):
+            rule = {'select': rule}
+        self.query = rule['select']
+        self.xpath = compile_query(self.query, precompiled)
+        self.join = rule.get('join')
+        self.strip = rule.get('strip')
+        self.regex = re.compile(rule['re']) if 're' in rule else None
+        self.prefix = rule.get('prefix')
+
+    def clean(self, value):
+        value = str(value)
+        if self.strip:
+            value = value.strip(None if self.strip is True else self.strip)
+        return value
+
+    def matches(self, node):
+        return [self.clean(value) for value in self.xpath(node)]
+
+    def extract(self, node):
+        values = self.matches(node)
+        if self.join is not None:
+            value = self.join.join(value for value in values if value or not self.strip)
+        else:
+            value = values[0] if values else None
+
+        if value and self.regex:
+            match = self.regex.search(value)
+            value = self.clean(match.group(1)) if match else None
+        if value and self.prefix and not value.startswith('http'):
+            value = self.prefix + value
+        return value or None
+
+
+class FirstOf:
+    """Alternative value rules, the first non-empty value wins."""
+
+    def __init__(self, rules, precompiled=True):
+        self.rules = [ValueRule(rule, precompiled) for rule in (rules if isinstance(rules, list) else [rules])]
+
+    def extract(self, node):
+        for rule in self.rules:
+            value = rule.extract(node)
+            if value:
+                return value
+        return None
+
+
+class ContentRule:
+    def __init__(self, rule, precompiled=True):
+        self.tag = rule.get('tag')
+        self.css_class = rule.get('class')
+        self.type = rule['type']
+        self.content = FirstOf(rule['content'], precompiled)
+        self.fields = {name: FirstOf(field, precompiled) for name, field in rule.get('fields', {}).items()}
+
+    def apply(self, element):
+        if self.tag and element.tag != self.tag:
+            return None
+        if self.css_class and self.css_class not in element.get('class', ''):
+            return None
+        content = self.content.extract(element)
+        if not content:
+            return None
+        item = {'type': self.type, 'content': content}
+        for name, field in self.fields.items():
+            item[name] = field.extract(element)
+        return item
+
+
+class SiteSpec:
+    """A site spec compiled into lxml XPath objects, ready to run on parsed pages."""
+
+    def __init__(self, spec, precompiled=True):
+        self.spec = spec
+        self.name = spec['name']
+        self.start_urls = spec['start_urls']
+        self.category_segment = spec['category_segment']
+        self.feeds = spec.get('feeds', {})
+
+        listing = spec['listing']
+        self.listing_items = compile_query(listing['items'], precompiled)
+        self.listing_url = FirstOf(listing['url'], precompiled)
+        self.listing_title = FirstOf(listing['title'], precompiled)
+        self.listing_thumbnail = FirstOf(listing['thumbnail'], precompiled)
+
+        self.content_elements = compile_query(spec['content']['elements'], precompiled)
+        self.content_rules = [ContentRule(rule, precompiled) for rule in spec['content']['rules']]
+        self.image = FirstOf(spec['image'], precompiled)
+
+        date = spec['published_date']
+        self.date_rule = ValueRule(date['select'], precompiled)
+        self.date_parts = date.get('parts')
+        self.date_format = date['format']
+        self.date_months = date.get('months')
+        self.timezone = pytz.timezone(date.get('timezone', 'UTC'))
+
+    def parse_content_element(self, element):
+        for rule in self.content_rules:
+            item = rule.apply(element)
+            if item:
+                return item
+        return None
+
+    def parse_published_date(self, root):
+        if self.date_parts:
+            values = self.date_rule.matches(root)
+            if len(values) <= max(self.date_parts):
+                return None
+            date_str = ' '.join(values[i].strip() for i in self.date_parts)
+        else:
+            date_str = self.date_rule.extract(root)
+        if not date_str:
+            return None
+
+        if self.date_format == 'iso':
+            dt = datetime.fromisoformat(date_str)
+            if dt.tzinfo is None:
+                dt = self.timezone.localize(dt)
+        else:
+            if self.date_months:
+                date_str = ' '.join(str(self.date_months.get(token, token)) for token in date_str.replace(',', '').split())
+            dt = self.timezone.localize(datetime.strptime(date_str, self.date_format))
+        return int(dt.astimezone(pytz.UTC).timestamp())
+
+
+class SpecSpider(BaseNewsSpider):
+    """A news spider driven entirely by a compiled SiteSpec."""
+
+    # Not a spider of its own, keeps Scrapy's spider loader from registering a second 'base_news'
+    name = None
+    site = None
+
+    def __init__(self, *args, **kwargs):
+        super(SpecSpider, self).__init__(*args, **kwargs)
+        self.article_count = {url: 0 for url in self.start_urls}
+        self.firebase_manager = FirebaseManager()
+        self.db = self.firebase_manager.client
+        self.url_ledger = self.get_url_ledger()
+        self.discovery_mode = get_project_settings().get('DISCOVERY_MODE')
+
+    def start_requests(self):
+        for url in self.start_urls:
+            feed = self.site.feeds.get(url) if self.discovery_mode == 'feed' else None
+            if feed:
+                yield Request(feed, self.parse_feed, errback=self.feed_failed, dont_filter=True,
+                              meta={'listing': True, 'listing_url': url})
+            else:
+                yield self.listing_request(url)
+
+    def listing_request(self, url):
+        return Request(url, self.parse, dont_filter=True, meta={'listing': True})
+
+    def parse(self, response):
+        listing_items = self.site.listing_items(response.selector.root)
+        # Only the links are needed to tell an unchanged listing, the other fields are extracted once it changed
+        article_urls = [self.site.listing_url.extract(article) for article in listing_items]
+        if self.listing_unchanged(response, article_urls):
+            return []
+        articles = [
+            {
+                'url': article_url,
+                'title': self.site.listing_title.extract(article),
+                'thumbnail': self.site.listing_thumbnail.extract(article),
+                'published': None
+            }
+            for article, article_url in zip(listing_items, article_urls)
+        ]
+        return self.follow_articles(response, response.url, articles)
+
+    def parse_feed(self, response):
+        articles = parse_feed(response.body)
+        listing_url = response.meta['listing_url']
+        if articles is None:
+            self.logger.warning(f"Not a feed, falling back to the listing: {response.url}")
+            return [self.listing_request(listing_url)]
+        if self.listing_unchanged(response, [article['url'] for article in articles]):
+            return []
+        return self.follow_articles(response, listing_url, articles)
+
+    def feed_failed(self, failure):
+        # 304s are dropped as IgnoreRequest too, an unchanged feed needs no fallback
+        if failure.check(IgnoreRequest) and not failure.check(HttpError):
+            return
+        self.logger.warning(f"Feed failed ({failure.value!r}), falling back to the listing: {failure.request.url}")
+        self.crawler.stats.inc_value('newsify/feed_fallbacks')
+        yield self.listing_request(failure.request.meta['listing_url'])
+
+    def follow_articles(self, response, listing_url, articles):
+        article_urls = [article['url'] for article in articles]
+        category = listing_url.split('/')[self.site.category_segment]
+        truncated = False
+        claimed_elsewhere = False
+        followed = []
+
+        for article in articles:
+            article_url = article['url']
+            if not article_url or self.is_stale(article['published']):
+                continue
+            if self.article_count[listing_url] >= self.max_articles:
+                truncated = True
+                continue
+
+            if self.is_scraped(category, article_url):
+                self.logger.info(f"Skipping already scraped article: {article_url}")
+            elif not self.claim(article_url):
+                self.logger.info(f"Skipping article claimed by another crawl: {article_url}")
+                claimed_elsewhere = True
+            else:
+                yield response.follow(
+                    article_url,
+                    callback=self.parse_article,
+                    errback=self.article_failed,
+                    meta={
+                        'article_title': article['title'],
+                        'article_url': article_url,
+                        'article_thumbnail': article['thumbnail'],
+                        'article_category': category,
+                        'article_published_date': article['published']
+                    }
+                )
+
+                self.article_count[listing_url] += 1
+                followed.append(article_url)
+
+        # Articles left out by the cap, or left to a claim that may yet fail, must be picked up next time
+        # even if the listing is unchanged
+        if not truncated and not claimed_elsewhere:
+            self.remember_listing(response, article_urls, followed)
+
+    def parse_article(self, response):
+        # Listings carry no dates, so stale articles can only be dropped here, before any OpenAI call
+        if self.is_stale(self.get_published_date(response)):
+            self.article_done(response.meta['article_url'])
+            return None
+        content = self.extract_content(response)
+        return self.create_article_item(response, content)
+
+    def get_content_elements(self, response):
+        return self.site.content_elements(response.selector.root)
+
+    def parse_content_element(self, element):
+        return self.site.parse_content_element(element)
+
+    def get_article_image(self, response):
+        return self.site.image.extract(response.selector.root)
+
+    def get_published_date(self, response):
+        return self.site.parse_published_date(response.selector.root) or response.meta.get('article_published_date')
+
+
+def spider_from_spec(spec, base=SpecSpider, module=None):
+    """Builds a spider class for a site spec, compiling its selectors once.
+
+    Pass the defining module's name so Scrapy's spider loader finds the class there.
+    """
+    class_name = ''.join(part.capitalize() for part in re.split(r'[^a-zA-Z0-9]', spec['name'])) + 'Spider'
+    return type(class_name, (base,), {
+        'name': spec['name'],
+        'start_urls': spec['start_urls'],
+        'site': SiteSpec(spec),
+        '__module__': module or base.__module__,
+    })
+
+
+def benchmark(spec, listing_html, article_html, rounds=200):
+    """Times one listing and one article page with precompiled selectors against re-parsed ones."""
+    listing_root = Selector(text=listing_html).root
+    article_root = Selector(text=article_html).root
+
+    results = {}
+    for label, precompiled in (('precompiled', True), ('re-parsed', False)):
+        site = SiteSpec(spec, precompiled)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for article in site.listing_items(listing_root):
+                site.listing_url.extract(article)
+                site.listing_title.extract(article)
+                site.listing_thumbnail.extract(article)
+            for element in site.content_elements(article_root):
+                site.parse_content_element(element)
+            site.image.extract(article_root)
+            site.parse_published_date(article_root)
+        results[label] = 1000 * (time.perf_counter() - start) / rounds
+    return results
+
+
+if __name__ == '__main__':
+    from ..sites import LAPSI, PAMFLETI, SYRI
+
+    parser = argparse.ArgumentParser(description="Benchmark the compiled extraction of a site spec on saved pages.")
+    parser.add_argument('site', choices=['lapsi', 'pamfleti', 'syri'])
+    parser.add_argument('listing_html')
+    parser.add_argument('article_html')
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    with open(args.listing_html, encoding='utf-8') as listing_file, open(args.article_html, encoding='utf-8') as article_file:
+        timings = benchmark({'lapsi': LAPSI, 'pamfleti': PAMFLETI, 'syri': SYRI}[args.site], listing_file.read(), article_file.read(), args.rounds)
+    for label, ms in timings.items():
+        print(f"{label}: {ms:.3f} ms per listing + article page")
@@ -0,0 +1,132 @@
+import logging
+import math
+import time
+from collections import Counter
+
+from .cluster_layout import get_cluster_article_refs, get_cluster_first_seen, get_cluster_last_seen
+
+logger = logging.getLogger(__name__)
+
+CLUSTER_FIELDS = ['article_refs', 'member_count', 'first_seen', 'last_seen', 'cluster_title', 'cluster_content']
+ARTICLE_FIELDS = ['article_title', 'article_url', 'article_thumbnail', 'article_image', 'article_published_date']
+
+
+def story_score(member_count, source_count, last_seen, now, half_life):
+    """Bigger stories covered by more outlets rank higher, halving in weight every `half_life` seconds."""
+    size = math.log1p(member_count) * math.sqrt(max(source_count, 1))
+    return size * 0.5 ** (max(now - last_seen, 0) / half_life)
+
+
+def get_excerpt(content, length=280):
+    # Cluster content is markdown with its own title line, skip headings
+    text = ' '.join(line.strip() for line in content.splitlines() if line.strip() and not line.lstrip().startswith('#'))
+    return text if len(text) <= length else text[:length].rsplit(' ', 1)[0] + '…'
+
+
+class StoryFeed:
+    """Ranked story feed documents, maintained by the clusterer for the read path.
+
+    The feed is split into `story_feed/page_<n>` documents of `page_size`
+    stories each, so a client renders a page with a single read. Every story
+    carries what the feed shows: title, excerpt, thumbnail, source counts and
+    its most recent member articles. A refresh only reads the clusters that
+    changed (and their member articles); all other stories are re-ranked from
+    the pages themselves.
+    """
+
+    def __init__(self, db, page_size=20, pages=10, half_life=6 * 60 * 60, window=7 * 24 * 60 * 60, top_articles=5):
+        self.db = db
+        self.collection = db.collection('story_feed')
+        self.page_size = page_size
+        self.pages = pages
+        self.half_life = half_life
+        self.window = window
+        self.top_articles = top_articles
+
+    def load_pages(self):
+        stories = {}
+        page_ids = []
+        for page in self.collection.stream():
+            page_ids.append(page.id)
+            for story in (page.to_dict() or {}).get('stories', []):
+                stories[story['cluster_id']] = story
+        return stories, page_ids
+
+    def build_story(self, cluster_id):
+        cluster_doc = self.db.collection('article_clusters').document(cluster_id).get(field_paths=CLUSTER_FIELDS)
+        if not cluster_doc.exists:
+            return None
+        cluster_data = cluster_doc.to_dict()
+        if 'member_count' not in cluster_data:
+            # Not migrated yet, the members are spread over articles_<timestamp> lists the projection leaves out
+            cluster_data = cluster_doc.reference.get().to_dict() or {}
+        article_refs = get_cluster_article_refs(cluster_data)
+        sources = Counter(ref.parent.parent.id for ref in article_refs)
+
+        articles = []
+        for article_doc in self.db.get_all(article_refs, field_paths=ARTICLE_FIELDS):
+            if article_doc.exists:
+                article_data = article_doc.to_dict()
+                articles.append({
+                    'title': article_data.get('article_title'),
+                    'url': article_data.get('article_url'),
+                    'thumbnail': article_data.get('article_thumbnail') or article_data.get('article_image'),
+                    'published_date': article_data.get('article_published_date', 0),
+                    'source': article_doc.reference.parent.parent.id,
+                    'path': article_doc.reference.path
+                })
+        articles.sort(key=lambda article: article['published_date'] or 0, reverse=True)
+
+        last_seen = get_cluster_last_seen(cluster_data)
+        return {
+            'cluster_id': cluster_id,
+            'title': cluster_data.get('cluster_title'),
+            'excerpt': get_excerpt(cluster_data.get('cluster_content') or ''),
+            'thumbnail': next((article['thumbnail'] for article in articles if article['thumbnail']), None),
+            'member_count': cluster_data.get('member_count', len(article_refs)),
+            'source_count': len(sources),
+            'sources': dict(sources),
+            'first_seen': get_cluster_first_seen(cluster_data),
+            'last_seen': last_seen,
+            'top_articles': articles[:self.top_articles]
+        }
+
+    def refresh(self, changed_ids=(), removed_ids=()):
+        """Rebuilds the stories of changed clusters, drops removed and expired ones, and re-ranks the feed."""
+        now = int(time.time())
+        stories, previous_page_ids = self.load_pages()
+
+        for cluster_id in removed_ids:
+            stories.pop(cluster_id, None)
+        for cluster_id in set(changed_ids):
+            story = self.build_story(cluster_id)
+            if story is None:
+                stories.pop(cluster_id, None)
+            else:
+                stories[cluster_id] = story
+
+        # Decay scales every score alike, so stories that did not change keep their relative order
+        # between refreshes; scores are recomputed so newly built stories compare at the same time
+        ranked = [story for story in stories.values() if story['last_seen'] >= now - self.window]
+        for story in ranked:
+            story['score'] = round(story_score(story['member_count'], story['source_count'], story['last_seen'], now, self.half_life), 6)
+        ranked.sort(key=lambda story: (story['score'], story['last_seen']), reverse=True)
+        ranked = ranked[:self.page_size * self.pages]
+
+        # One batch, so readers never see a feed that is half old and half new
+        page_count = math.ceil(len(ranked) / self.page_size)
+        page_ids = [f'page_{page}' for page in range(page_count)]
+        batch = self.db.batch()
+        for page, page_id in enumerate(page_ids):
+            batch.set(self.collection.document(page_id), {
+                'page': page,
+                'page_count': page_count,
+                'updated': now,
+                'stories': ranked[page * self.page_size:(page + 1) * self.page_size]
+            })
+        for page_id in set(previous_page_ids) - set(page_ids):
+            batch.delete(self.collection.document(page_id))
+        batch.commit()
+
+        logger.info(f"Story feed refreshed: {len(set(changed_ids))} stories rebuilt, {len(ranked)} stories on {page_count} pages.")
+        return ranked
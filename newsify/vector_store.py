@@ -0,0 +1,209 @@
+import json
+import os
+
+import numpy as np
+
+
+class VectorStore:
+    """Append-only, memory-mapped store of unit-normalized embeddings.
+
+    Vectors are kept as contiguous float32 rows in `vectors.f32`, optionally
+    mirrored by a quantized copy (float16, or int8 with per-row scales) that
+    is scanned first. An append-only `index.jsonl` maps ids to their latest
+    row, so updating a vector appends a new row and leaves the old one as
+    garbage until `compact` is called.
+
+    Layout of a store directory:
+        meta.json     dimensions and quantization
+        vectors.f32   float32 rows
+        vectors.q     quantized rows (float16 or int8), if enabled
+        scales.f32    per-row int8 scales, if int8
+        index.jsonl   one {"id", "row", "updated"} or {"id", "removed"} per line
+    """
+
+    QUANTIZATIONS = (None, 'float16', 'int8')
+    BLOCK_ROWS = 8192
+
+    def __init__(self, path, dim=512, quantization=None):
+        if quantization not in self.QUANTIZATIONS:
+            raise ValueError(f"Unsupported quantization: {quantization}")
+
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta['dim'] != dim or meta['quantization'] != quantization:
+                raise ValueError(f"Vector store at {path} was created with {meta}, compact it into a new store to change it")
+        else:
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'dim': dim, 'quantization': quantization}, f)
+
+        self.dim = dim
+        self.quantization = quantization
+        self.ids = {}
+        self.updated = {}
+        self._load_index()
+        self._open()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _load_index(self):
+        index_path = self._file('index.jsonl')
+        if not os.path.exists(index_path):
+            return
+
+        rows = os.path.getsize(self._file('vectors.f32')) // (self.dim * 4) if os.path.exists(self._file('vectors.f32')) else 0
+        with open(index_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn last line from an interrupted append
+                    continue
+                if entry.get('removed'):
+                    self.ids.pop(entry['id'], None)
+                    self.updated.pop(entry['id'], None)
+                elif entry['row'] < rows:
+                    self.ids[entry['id']] = entry['row']
+                    self.updated[entry['id']] = entry['updated']
+
+    def _open(self):
+        """(Re)maps the data files, called after every append."""
+        rows = os.path.getsize(self._file('vectors.f32')) // (self.dim * 4) if os.path.exists(self._file('vectors.f32')) else 0
+        self.rows = rows
+        self.vectors = self._map('vectors.f32', np.float32, rows)
+        self.quantized = None
+        self.scales = None
+        if self.quantization == 'float16':
+            self.quantized = self._map('vectors.q', np.float16, rows)
+        elif self.quantization == 'int8':
+            self.quantized = self._map('vectors.q', np.int8, rows)
+            self.scales = self._map('scales.f32', np.float32, rows, 1)[:, 0]
+
+    def _map(self, name, dtype, rows, dim=None):
+        dim = dim or self.dim
+        if rows == 0:
+            return np.empty((0, dim), dtype=dtype)
+        return np.memmap(self._file(name), dtype=dtype, mode='r', shape=(rows, dim))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, vector_id):
+        return vector_id in self.ids
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def add_many(self, entries):
+        """Appends (id, vector, updated) entries; existing ids point to the new row."""
+        entries = list(entries)
+        if not entries:
+            return
+
+        vectors = self._normalize([vector for _, vector, _ in entries])
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+
+        with open(self._file('vectors.f32'), 'ab') as f:
+            f.write(vectors.tobytes())
+        if self.quantization == 'float16':
+            with open(self._file('vectors.q'), 'ab') as f:
+                f.write(vectors.astype(np.float16).tobytes())
+        elif self.quantization == 'int8':
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            with open(self._file('vectors.q'), 'ab') as f:
+                f.write(np.round(vectors / scales[:, None]).astype(np.int8).tobytes())
+            with open(self._file('scales.f32'), 'ab') as f:
+                f.write(scales.astype(np.float32).tobytes())
+
+        # Rows are written before the index, so a crash never leaves the index pointing past the data
+        with open(self._file('index.jsonl'), 'a', encoding='utf-8') as f:
+            for offset, (vector_id, _, updated) in enumerate(entries):
+                row = self.rows + offset
+                f.write(json.dumps({'id': vector_id, 'row': row, 'updated': updated}) + '\n')
+                self.ids[vector_id] = row
+                self.updated[vector_id] = updated
+
+        self._open()
+
+    def add(self, vector_id, vector, updated=0):
+        self.add_many([(vector_id, vector, updated)])
+
+    def remove(self, vector_ids):
+        vector_ids = [vector_id for vector_id in vector_ids if vector_id in self.ids]
+        with open(self._file('index.jsonl'), 'a', encoding='utf-8') as f:
+            for vector_id in vector_ids:
+                f.write(json.dumps({'id': vector_id, 'removed': True}) + '\n')
+                del self.ids[vector_id]
+                del self.updated[vector_id]
+
+    def get(self, vector_id):
+        return self.vectors[self.ids[vector_id]]
+
+    def ids_since(self, timestamp):
+        return [vector_id for vector_id, updated in self.updated.items() if updated >= timestamp]
+
+    def matrix(self, vector_ids):
+        """Float32 rows for the given ids; a view of the mapped file when the rows are contiguous."""
+        rows = [self.ids[vector_id] for vector_id in vector_ids]
+        if rows and rows == list(range(rows[0], rows[0] + len(rows))):
+            return self.vectors[rows[0]:rows[0] + len(rows)]
+        return self.vectors[rows]
+
+    def _scan(self, query):
+        """Scores every row against the query block by block, on the cheapest copy available."""
+        matrix = self.quantized if self.quantized is not None else self.vectors
+        scores = np.empty(self.rows, dtype=np.float32)
+        for start in range(0, self.rows, self.BLOCK_ROWS):
+            block = matrix[start:start + self.BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32, copy=False) @ query
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+    def search(self, query, k=1, vector_ids=None, oversample=4):
+        """Returns the k (id, cosine similarity) pairs closest to the query.
+
+        With quantization enabled the quantized rows only select candidates,
+        which are then reranked with the full-precision vectors.
+        """
+        if vector_ids is None:
+            vector_ids = list(self.ids)
+        if not vector_ids or self.rows == 0:
+            return []
+
+        query = self._normalize(query)
+        rows = np.fromiter((self.ids[vector_id] for vector_id in vector_ids), dtype=np.int64, count=len(vector_ids))
+        scores = self._scan(query)[rows]
+
+        candidates = min(len(rows), k * oversample if self.quantized is not None else k)
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+        if self.quantized is not None:
+            scores[top] = self.vectors[rows[top]] @ query
+        top = top[np.argsort(-scores[top])][:k]
+        return [(vector_ids[i], float(scores[i])) for i in top]
+
+    def compact(self):
+        """Rewrites the store with only the live rows, in id order."""
+        entries = [(vector_id, np.array(self.get(vector_id)), self.updated[vector_id]) for vector_id in self.ids]
+        for name in ('vectors.f32', 'vectors.q', 'scales.f32', 'index.jsonl'):
+            if os.path.exists(self._file(name)):
+                os.replace(self._file(name), self._file(f'{name}.old'))
+
+        self.ids = {}
+        self.updated = {}
+        self._open()
+        self.add_many(entries)
+
+        for name in ('vectors.f32', 'vectors.q', 'scales.f32', 'index.jsonl'):
+            if os.path.exists(self._file(f'{name}.old')):
+                os.remove(self._file(f'{name}.old'))
@@ -1,37 +1,246 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+
 from scrapy import signals
-from scrapy.crawler import CrawlerProcess
+from scrapy.crawler import CrawlerProcess, CrawlerRunner
+from scrapy.utils.log import configure_logging
 from scrapy.utils.project import get_project_settings
-from newsify.spiders.lapsi_spider import LapsiSpider
-from newsify.spiders.pamfleti_spider import PamfletiSpider
+from scrapy.utils.reactor import install_reactor
+from newsify.crawl_ledger import CrawlLedger
+from newsify.recrawl import RecrawlPolicy
+from newsify.spiders.site_spiders import LapsiSpider, PamfletiSpider
 from newsify.spiders.syri_spider import SyriSpider
 
+logger = logging.getLogger(__name__)
+
+SPIDERS = [
+    ('Lapsi', LapsiSpider),
+    ('Pamfleti', PamfletiSpider),
+    ('Syri', SyriSpider)
+]
+
 class SpiderOutput:
+    """Counts scraped items without retaining them, items stream through the pipelines."""
+
     def __init__(self):
-        self.items = []
+        self.item_count = 0
 
     def item_scraped(self, item):
-        self.items.append(item)
+        self.item_count += 1
 
-def run_spiders():
-    process = CrawlerProcess(get_project_settings())
-    
-    spiders = [
-        ('Lapsi', LapsiSpider),
-        ('Pamfleti', PamfletiSpider),
-        ('Syri', SyriSpider)
+def get_shards(spiders, by_section=False):
+    """Splits the crawl into (name, spider class, start URLs) units of work for the workers."""
+    if not by_section:
+        return [(name, spider_class, list(spider_class.start_urls)) for name, spider_class in spiders]
+    return [
+        (f"{name}[{url}]", spider_class, [url])
+        for name, spider_class in spiders
+        for url in spider_class.start_urls
     ]
-    
-    results = {}
-    for name, spider_class in spiders:
+
+def get_numeric_stats(crawler):
+    return {key: value for key, value in crawler.stats.get_stats().items() if isinstance(value, (int, float))}
+
+def run_spiders(shards=None, report=None):
+    process = CrawlerProcess(get_project_settings())
+
+    crawlers = []
+    for name, spider_class, start_urls in shards or get_shards(SPIDERS):
         print(f"Adding {name} spider to the process...")
         output = SpiderOutput()
         crawler = process.create_crawler(spider_class)
         crawler.signals.connect(output.item_scraped, signal=signals.item_scraped)
-        process.crawl(crawler)
-        results[name] = output
+        process.crawl(crawler, start_urls=start_urls)
+        crawlers.append((name, crawler))
 
     print("Starting the crawling process...")
     process.start()
 
+    if report is not None:
+        for name, crawler in crawlers:
+            report(name, get_numeric_stats(crawler))
+
+class CrawlDaemon:
+    """Re-polls every source forever, each on its own adaptive interval.
+
+    All crawls share one reactor and one process, so clients such as the
+    Firebase connection stay warm between crawls.
+    """
+
+    def __init__(self, settings, shards, report=None):
+        self.settings = settings
+        self.shards = shards
+        self.report = report
+        self.runner = CrawlerRunner(settings)
+        self.policies = {name: RecrawlPolicy.from_settings(settings) for name, _, _ in shards}
+        self.max_articles = settings.getint('RECRAWL_MAX_ARTICLES')
+        self.pending = {}
+        self.stopping = False
+
+    def start(self):
+        from twisted.internet import reactor
+
+        for shard in self.shards:
+            reactor.callWhenRunning(self.crawl, *shard)
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: reactor.callFromThread(self.stop))
+        reactor.run(installSignalHandlers=False)
+
+    def stop(self):
+        """Lets running crawls finish their in-flight requests, then stops the reactor."""
+        from twisted.internet import reactor
+
+        if self.stopping:
+            return
+        self.stopping = True
+        logger.info("Shutting down, waiting for running crawls to close...")
+        for call in self.pending.values():
+            if call.active():
+                call.cancel()
+        self.runner.stop().addBoth(lambda _: reactor.stop())
+
+    def crawl(self, name, spider_class, start_urls):
+        self.pending.pop(name, None)
+        output = SpiderOutput()
+        crawler = self.runner.create_crawler(spider_class)
+        crawler.signals.connect(output.item_scraped, signal=signals.item_scraped)
+        logger.info(f"Crawling {name}...")
+        d = self.runner.crawl(crawler, max_articles=self.max_articles, start_urls=start_urls)
+        d.addErrback(lambda failure: logger.error(f"{name} crawl failed: {failure.getErrorMessage()}"))
+        d.addBoth(lambda _: self.schedule_next(name, spider_class, start_urls, crawler, output))
+        return d
+
+    def schedule_next(self, name, spider_class, start_urls, crawler, output):
+        from twisted.internet import reactor
+
+        if self.report is not None:
+            self.report(name, get_numeric_stats(crawler))
+        if self.stopping:
+            return
+
+        stats = crawler.stats.get_stats()
+        links_seen = stats.get('newsify/listing_links', 0)
+        links_new = stats.get('newsify/listing_new_links', 0)
+        policy = self.policies[name]
+        interval = policy.observe(links_seen, links_new, time.time())
+        logger.info(
+            f"{name}: {output.item_count} articles scraped, {links_new}/{links_seen} new listing links. "
+            f"Next crawl in {interval:.0f}s."
+        )
+        self.pending[name] = reactor.callLater(interval, self.crawl, name, spider_class, start_urls)
+
+def run_daemon(shards=None, report=None):
+    settings = get_project_settings()
+    install_reactor(settings.get('TWISTED_REACTOR'))
+    configure_logging(settings)
+    CrawlDaemon(settings, shards or get_shards(SPIDERS), report).start()
+
+def crawl_worker(worker_id, shards, daemon, stats_queue):
+    """Entry point of a sharded crawl worker process, with its own reactor."""
+    def report(name, stats):
+        stats_queue.put((worker_id, name, stats))
+
+    if daemon:
+        run_daemon(shards, report)
+    else:
+        run_spiders(shards, report)
+
+def run_sharded(workers, daemon=False, by_section=False):
+    """Spreads the crawl over worker processes, each running its own reactor.
+
+    Workers claim article URLs in the shared crawl ledger, so no two of them
+    follow the same article. The launcher logs and sums the stats every
+    worker reports after each crawl, and on SIGINT/SIGTERM asks the workers
+    to shut down gracefully, terminating those still running after
+    CRAWL_SHUTDOWN_TIMEOUT.
+    """
+    settings = get_project_settings()
+    configure_logging(settings)
+    ledger = CrawlLedger.from_settings(settings)
+    if ledger is None:
+        logger.warning("CRAWL_LEDGER_PATH is not set, workers may scrape the same articles.")
+    else:
+        ledger.prune()
+        ledger.close()
+
+    shards = get_shards(SPIDERS, by_section)
+    workers = max(1, min(workers, len(shards)))
+    context = multiprocessing.get_context('spawn')
+    stats_queue = context.Queue()
+    processes = []
+    for worker_id in range(workers):
+        worker_shards = shards[worker_id::workers]
+        process = context.Process(
+            target=crawl_worker, args=(worker_id, worker_shards, daemon, stats_queue), name=f'crawl-worker-{worker_id}'
+        )
+        process.start()
+        logger.info(f"Worker {worker_id} (pid {process.pid}) crawling {', '.join(name for name, _, _ in worker_shards)}")
+        processes.append(process)
+
+    shutdown_requested = []
+
+    def request_shutdown(signum, frame):
+        if shutdown_requested:
+            return
+        shutdown_requested.append(time.time())
+        logger.info("Shutdown requested, stopping workers...")
+        # A Ctrl-C already reached the workers through the process group, a second signal would force them
+        if signum == signal.SIGINT:
+            return
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, request_shutdown)
+    signal.signal(signal.SIGTERM, request_shutdown)
+
+    totals = {}
+    shutdown_timeout = settings.getfloat('CRAWL_SHUTDOWN_TIMEOUT')
+    while True:
+        try:
+            worker_id, name, stats = stats_queue.get(timeout=1)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                break
+            if shutdown_requested and time.time() - shutdown_requested[0] > shutdown_timeout:
+                for process in processes:
+                    if process.is_alive():
+                        logger.warning(f"Worker {process.name} did not stop in time, terminating it.")
+                        process.terminate()
+                shutdown_requested[0] = float('inf')
+            continue
+
+        logger.info(
+            f"Worker {worker_id} finished {name}: {stats.get('item_scraped_count', 0)} articles, "
+            f"{stats.get('newsify/listing_new_links', 0)}/{stats.get('newsify/listing_links', 0)} new listing links, "
+            f"{stats.get('newsify/claimed_elsewhere', 0)} claimed by other workers."
+        )
+        for key, value in stats.items():
+            totals[key] = totals.get(key, 0) + value
+
+    for process in processes:
+        process.join()
+        if process.exitcode:
+            logger.warning(f"Worker {process.name} exited with code {process.exitcode}")
+    logger.info("Crawl totals: " + ", ".join(f"{key}={value}" for key, value in sorted(totals.items())))
+    return totals
+
 if __name__ == '__main__':
-    run_spiders()
+    parser = argparse.ArgumentParser(description="Run the newsify spiders.")
+    parser.add_argument('--daemon', action='store_true', help="Keep re-crawling every source on an adaptive interval.")
+    parser.add_argument('--workers', type=int, default=1, help="Spread the sources over this many crawler processes.")
+    parser.add_argument('--by-section', action='store_true',
+                        help="With --workers, shard by listing page instead of by source, for sources with many sections.")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        run_sharded(args.workers, daemon=args.daemon, by_section=args.by_section)
+    elif args.daemon:
+        run_daemon()
+    else:
+        run_spiders()